@@ -0,0 +1,186 @@
+'''JSON read API for venues, artists and shows.
+
+    GET /api/v1/<resource>?fields=id,name,shows&limit=50&after=<id>
+    GET /api/v1/<resource>?ids=3,1,2&fields=...
+    GET /api/v1/<resource>/<id>?fields=...
+
+`fields` picks the columns (mapped to load_only) and relationships
+(loaded with selectinload or joinedload only when asked for). Leaving it
+out returns every column and no relationships. Lists are keyset-paginated
+on id. With `ids` the list resolves up to MAX_IDS records in one IN query
+instead, in the order requested, and reports the ids that do not exist.
+'''
+from datetime import datetime
+from operator import attrgetter
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+from models import Artist, Venue, Show
+from routing import read_only
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_IDS = 500
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _shows_of(counterpart_fk):
+    '''Relationship spec for an entity's shows, seen from the given side.'''
+    name = counterpart_fk.key
+
+    def serialize(shows):
+        return [
+            {'id': show.id, name: getattr(show, name), 'start_time': show.start_time.isoformat()}
+            for show in shows
+        ]
+    return (
+        lambda model: selectinload(model.shows).load_only(Show.start_time, counterpart_fk),
+        serialize,
+    )
+
+
+def _entity_of(relationship, model, *columns):
+    '''Relationship spec for the venue or artist of a show.'''
+    names = ('id',) + tuple(column.key for column in columns)
+    getter = attrgetter(*names)
+
+    def serialize(entity):
+        return dict(zip(names, getter(entity)))
+    return (
+        lambda _: joinedload(relationship).load_only(*columns),
+        serialize,
+    )
+
+
+class Resource(object):
+
+    def __init__(self, model, relationships):
+        self.model = model
+        self.columns = [attr.key for attr in inspect(model).column_attrs]
+        self.relationships = relationships
+
+    def parse_fields(self, raw):
+        '''Split `fields=` into (columns, relationships); ValueError if unknown.'''
+        if not raw:
+            return self.columns, []
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [n for n in names if n not in self.columns and n not in self.relationships]
+        if unknown:
+            raise ValueError('unknown fields: {}'.format(', '.join(unknown)))
+        columns = [n for n in names if n in self.columns]
+        if 'id' not in columns:
+            columns.insert(0, 'id')
+        return columns, [n for n in names if n in self.relationships]
+
+    def query(self, columns, relationships):
+        options = [load_only(*[getattr(self.model, c) for c in columns])]
+        options += [self.relationships[r][0](self.model) for r in relationships]
+        return self.model.query.options(*options)
+
+    def serializer(self, columns, relationships):
+        getter = attrgetter(*columns)
+        if len(columns) == 1:
+            get_values = lambda obj: (getter(obj),)
+        else:
+            get_values = getter
+        related = [(r, attrgetter(r), self.relationships[r][1]) for r in relationships]
+
+        def serialize(obj):
+            data = {name: _value(value) for name, value in zip(columns, get_values(obj))}
+            for name, get, serialize_related in related:
+                data[name] = serialize_related(get(obj))
+            return data
+        return serialize
+
+
+resources = {
+    'venues': Resource(Venue, {'shows': _shows_of(Show.artist_id)}),
+    'artists': Resource(Artist, {'shows': _shows_of(Show.venue_id)}),
+    'shows': Resource(Show, {
+        'venue': _entity_of(Show.venue, Venue, Venue.name),
+        'artist': _entity_of(Show.artist, Artist, Artist.name, Artist.image_link),
+    }),
+}
+
+
+def _error(message, status=400):
+    return jsonify({'error': message}), status
+
+
+def parse_ids(raw):
+    '''Parse `ids=3,1,2` into distinct ints in request order; ValueError if malformed.'''
+    ids = []
+    for part in raw.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            ids.append(int(part))
+        except ValueError:
+            raise ValueError('ids must be comma-separated integers')
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError('ids must list at least one id')
+    if len(ids) > MAX_IDS:
+        raise ValueError('at most {} ids per request'.format(MAX_IDS))
+    return ids
+
+
+def batch_resource(resource, raw_ids, columns, relationships):
+    try:
+        ids = parse_ids(raw_ids)
+    except ValueError as e:
+        return _error(str(e))
+    rows = resource.query(columns, relationships).filter(resource.model.id.in_(ids)).all()
+    found = {row.id: row for row in rows}
+    serialize = resource.serializer(columns, relationships)
+    return jsonify({
+        'data': [serialize(found[id]) for id in ids if id in found],
+        'missing': [id for id in ids if id not in found],
+    })
+
+
+@api.route('/<any(venues, artists, shows):name>')
+@read_only
+def list_resource(name):
+    resource = resources[name]
+    try:
+        columns, relationships = resource.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return _error(str(e))
+    if 'ids' in request.args:
+        return batch_resource(resource, request.args['ids'], columns, relationships)
+    limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
+
+    query = resource.query(columns, relationships).order_by(resource.model.id)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(resource.model.id > after)
+    rows = query.limit(limit + 1).all()
+
+    serialize = resource.serializer(columns, relationships)
+    return jsonify({
+        'data': [serialize(row) for row in rows[:limit]],
+        'next': rows[limit - 1].id if len(rows) > limit else None,
+    })
+
+
+@api.route('/<any(venues, artists, shows):name>/<int:id>')
+@read_only
+def get_resource(name, id):
+    resource = resources[name]
+    try:
+        columns, relationships = resource.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return _error(str(e))
+    obj = resource.query(columns, relationships).filter(resource.model.id == id).first()
+    if obj is None:
+        return _error('{} {} not found'.format(name[:-1], id), 404)
+    return jsonify({'data': resource.serializer(columns, relationships)(obj)})
@@ -6,72 +6,107 @@
 import os
 import json
 import sys
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-from flask_migrate import Migrate
+from datetime import datetime
+from flask import render_template, request, Response, flash, redirect, url_for, jsonify, session, current_app
 from sqlalchemy.orm import load_only
-from models import Artist, Venue, Show, app, db
+from models import Artist, Venue, Show, db
+from autocomplete import lookup, name_indexes
+from cache import fragments
+from clock import now
+from dates import current_locale, format_datetime, format_datetimes
+from factory import create_app
+from freshness import artists_validator, conditional_get, entity_validator, shows_validator, venues_validator
+from page_cache import page_cache
+from queries import InvalidCursor, parse_date_bound, show_history, show_listing, show_page
+from querystats import query_budget
+from routing import pinned_to_primary, read_from_primary, read_only
+from search import search
+from singleflight import single_flight
+from summary import record_venue, summary_areas
+
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-
+# factory.create_app builds and configures the app, then calls register_views
+# (at the end of this module) to add the routes, filters and error handlers.
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  if isinstance(value, str):
-    date = dateutil.parser.parse(value)
-  else:
-    date = value
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
-app.jinja_env.filters['datetime'] = format_datetime
+def inject_now():
+  return {'now': now(), 'locale': current_locale()}
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@read_only
+@page_cache.cached(ttl=300, stale_ttl=3600)
 def index():
   return render_template('pages/home.html')
+
+#  Fragment cache
+#  ----------------------------------------------------------------
+
+def fragment_cacheable():
+  # A page rendered with pending flash messages consumes them, so it is never
+  # served from or stored in the cache. Decide on entry: rendering pops them.
+  return not session.get('_flashes')
+
+_counterparts = {
+  'venue': (Show.venue_id, Show.artist_id, 'artist'),
+  'artist': (Show.artist_id, Show.venue_id, 'venue'),
+}
+
+def bump_fragments(kind, entity_id):
+  # the entity's page, and the pages of everything it shares shows with,
+  # which list its name and image
+  fk, counterpart_fk, counterpart = _counterparts[kind]
+  fragments.bump(kind, entity_id)
+  for (counterpart_id,) in db.session.query(counterpart_fk).filter(fk == entity_id).distinct():
+    fragments.bump(counterpart, counterpart_id)
+
+#  Single flight
+#  ----------------------------------------------------------------
+
+def coalesced(key, fn):
+  # A visitor pinned to the primary after a write must see that write, so
+  # they never join a build that may predate their commit or read a replica.
+  if pinned_to_primary():
+    return fn()
+  return single_flight.do(key, fn, current_app.config['SINGLE_FLIGHT_TIMEOUT'])
+
+#  Show history
+#  ----------------------------------------------------------------
+
+def show_history_page(side, entity_id):
+  kind = request.args.get('kind', 'past')
+  if kind not in ('past', 'upcoming'):
+    return jsonify({'error': 'kind must be past or upcoming'}), 400
+  try:
+    shows, next_cursor = show_page(
+      side, entity_id, kind, now(), current_app.config['SHOWS_PAGE_SIZE'],
+      after=request.args.get('after')
+    )
+  except InvalidCursor:
+    return jsonify({'error': 'invalid cursor'}), 400
+  for show in shows:
+    show['start_time'] = show['start_time'].isoformat()
+  return jsonify({'data': shows, 'next': next_cursor})
+
 #  Venues
 #  ----------------------------------------------------------------
-@app.route('/venues')
+@read_only
+# validator + summary read, whatever the catalogue size; one spare for a replica lag check
+@query_budget(queries=3, repeats=1)
+@page_cache.cached(ttl=60, stale_ttl=600)
+@conditional_get(venues_validator)
 def venues():
-  locations = Venue.query.distinct(Venue.city, Venue.state).all()
   data = []
   try:
-    for location in locations:
-      temporary_data = {}
-      temporary_data = {
-        'city': location.city,
-        'state': location.state
-      }
-      venues = []
-      venue_data = Venue.query.filter(Venue.city == location.city, Venue.state == location.state).all()
-      for venue in venue_data:
-        temp_data = {
-          'id': venue.id,
-          'name': venue.name,
-          'num_upcoming_shows': len(list(filter(lambda x: x.start_time > datetime.today(), venue.shows )))
-        }
-        venues.append(temp_data)
-      temporary_data['venues'] = venues
-      data.append(temporary_data)
+    data = coalesced(('venues',), summary_areas)
     
   except:
     db.session.rollback()
@@ -84,100 +119,81 @@ def venues():
   
   
 
-@app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
   #* done
   search_info = request.form.get('search_term', '')
-  venues = Venue.query.filter(
-    Venue.name.ilike('%{}%'.format(search_info))
-  ).all()
-
-  data = []
-  for venue in venues:
-    temporary_data = {}
-    temporary_data['id'] = venue.id
-    temporary_data['name'] = venue.name
-    temporary_data['num_upcoming_shows'] = len(list(filter(lambda x: x.start_time > datetime.today(), venue.shows )))
-    data.append(temporary_data)
-  
-  response = {}
-  response['count'] = len(data)
-  response['data'] = data
+  response = search(Venue, search_info, current_app.config['SEARCH_RESULTS_LIMIT'])
   
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/venues/<int:venue_id>')
+def venue_page_data(venue_id):
+  venue = Venue.query.get(venue_id)
+  if venue is None:
+    return None
+  data={
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+  }
+  data.update(show_history('venue', venue_id, now(), current_app.config['SHOWS_PAGE_SIZE']))
+  return data
+
+@read_only
+@conditional_get(lambda venue_id: entity_validator('venue', venue_id))
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # *done
+  html, version = fragments.get('venue', venue_id, current_locale())
+  cacheable = fragment_cacheable()
+  if cacheable:
+    if html is not None:
+      return html
+    read_from_primary()
+
   data = {}
   
   try: 
-    venue = Venue.query.get(venue_id)
-    if venue is None:
+    # keyed by version: a build started before an edit's bump is never shared after it
+    data = coalesced(('venue', venue_id, version), lambda: venue_page_data(venue_id))
+    if data is None:
       return not_found_error(404) 
-    unfiltered_past_shows = list(filter(lambda x: x.start_time < datetime.today(), venue.shows))
-
-    unfiltered_upcoming_shows = list(filter(lambda x: x.start_time > datetime.today(), venue.shows))
-
-    past_shows = []
-    for show in unfiltered_past_shows:
-      artist = Artist.query.get(show.artist_id)
-      filtered_show_data = {
-        'artist_id': artist.id,
-        'artist_name': artist.name, 
-        'artist_image_link': artist.image_link,
-        'start_time': show.start_time
-      }
-      past_shows.append(filtered_show_data)
-    upcoming_shows = []
-    for show in unfiltered_upcoming_shows:
-      artist = Artist.query.get(show.artist_id)
-      filtered_show_data = {
-        'artist_id': artist.id,
-        'artist_name': artist.name, 
-        'artist_image_link': artist.image_link,
-        'start_time': show.start_time
-      }
-      upcoming_shows.append(filtered_show_data)
-      
-    data={
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_talent,
-      "seeking_description": venue.seeking_description,
-      "image_link": venue.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-    }
     # print(data['genres'])
   except:
+    cacheable = False
     print(sys.exc_info())
     flash('Something went wrong. Please try again.')
 
   finally:
     db.session.close()
 
-  return render_template('pages/show_venue.html', venue=data)
+  html = render_template('pages/show_venue.html', venue=data)
+  if cacheable:
+    fragments.set('venue', venue_id, html, version, current_locale())
+  return html
+
+@read_only
+def venue_shows(venue_id):
+  # one page of the venue's past or upcoming shows, e.g. ?kind=past&after=<cursor>
+  return show_history_page('venue', venue_id)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
 def create_venue_form():
+  from forms import VenueForm
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   
   try:
@@ -195,8 +211,10 @@ def create_venue_submission():
       seeking_description = request.form.get('seeking_description')
     )
     db.session.add(new_venue)
+    record_venue(new_venue)
     db.session.commit()
     db.session.refresh(new_venue)
+    page_cache.invalidate('/venues')
     flash('Venue {} was successfully listed!'.format(request.form.get('name')))
   
   except:
@@ -210,7 +228,9 @@ def create_venue_submission():
   
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@read_only
+@page_cache.cached(ttl=60, stale_ttl=600)
+@conditional_get(artists_validator, if_modified_since=True)
 def artists():
   #* done
   cols = ['id', 'name']
@@ -218,85 +238,55 @@ def artists():
   
   return render_template('pages/artists.html', artists=data)
 
-@app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
   # *done
   search_info = request.form.get('search_term', '')
-  
-  artists = Artist.query.filter(
-    Artist.name.ilike('%{}%'.format(search_info))
-  ).all()
-
-  data = []
-  for artist in artists:
-    temporary_data = {}
-    temporary_data['id'] = artist.id
-    temporary_data['name'] = artist.name
-    temporary_data['num_upcoming_shows'] = len(list(filter(lambda x: x.start_time > datetime.today(), artist.shows )))
-    data.append(temporary_data)
-  
-  response = {}
-  response['count'] = len(data)
-  response['data'] = data
+  response = search(Artist, search_info, current_app.config['SEARCH_RESULTS_LIMIT'])
   
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
-@app.route('/artists/<int:artist_id>')
+def artist_page_data(artist_id):
+  artist = Artist.query.get(artist_id)
+  if artist is None:
+    return None
+  data={
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+  }
+  data.update(show_history('artist', artist_id, now(), current_app.config['SHOWS_PAGE_SIZE']))
+  return data
+
+@read_only
+@conditional_get(lambda artist_id: entity_validator('artist', artist_id))
 def show_artist(artist_id):
   # shows the artist page with the given artist_id
   # * done
+  html, version = fragments.get('artist', artist_id, current_locale())
+  cacheable = fragment_cacheable()
+  if cacheable:
+    if html is not None:
+      return html
+    read_from_primary()
+
   data = {}
   
   try: 
-    artist = Artist.query.get(artist_id)
-    if artist is None:
+    data = coalesced(('artist', artist_id, version), lambda: artist_page_data(artist_id))
+    if data is None:
       return not_found_error(404) 
-
-    unfiltered_past_shows = list(filter(lambda x: x.start_time < datetime.today(), artist.shows))
-
-    unfiltered_upcoming_shows = list(filter(lambda x: x.start_time > datetime.today(), artist.shows))
-
-    past_shows = []
-    for show in unfiltered_past_shows:
-      venue = Venue.query.get(show.venue_id)
-      filtered_show_data = {
-        'venue_id': venue.id,
-        'venue_name': venue.name, 
-        'venue_image_link': venue.image_link,
-        'start_time': show.start_time
-      }
-      past_shows.append(filtered_show_data)
-
-    upcoming_shows = []
-    for show in unfiltered_upcoming_shows:
-      venue = Venue.query.get(show.venue_id)
-      filtered_show_data = {
-        'venue_id' : venue.id,
-        'venue_name': venue.name, 
-        'venue_image_link': venue.image_link,
-        'start_time': show.start_time
-      }
-      upcoming_shows.append(filtered_show_data)
-      
-    data={
-      "id": artist.id,
-      "name": artist.name,
-      "genres": artist.genres,
-      "city": artist.city,
-      "state": artist.state,
-      "phone": artist.phone,
-      "website": artist.website,
-      "facebook_link": artist.facebook_link,
-      "seeking_venue": artist.seeking_venue,
-      "seeking_description": artist.seeking_description,
-      "image_link": artist.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-    }
   
   except:
+    cacheable = False
     print(sys.exc_info())
     flash('Something went wrong. Please try again.')
 
@@ -304,12 +294,20 @@ def show_artist(artist_id):
     db.session.close()
   
   
-  return render_template('pages/show_artist.html', artist=data)
+  html = render_template('pages/show_artist.html', artist=data)
+  if cacheable:
+    fragments.set('artist', artist_id, html, version, current_locale())
+  return html
+
+@read_only
+def artist_shows(artist_id):
+  # one page of the artist's past or upcoming shows, e.g. ?kind=past&after=<cursor>
+  return show_history_page('artist', artist_id)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+  from forms import ArtistForm
   form = ArtistForm()
   
   data = {}
@@ -344,7 +342,6 @@ def edit_artist(artist_id):
   # *done
   return render_template('forms/edit_artist.html', form=form, artist=data)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # *done
   try:
@@ -367,6 +364,8 @@ def edit_artist_submission(artist_id):
     db.session.add(update_artist)
     db.session.commit()
     db.session.refresh(update_artist)
+    bump_fragments('artist', artist_id)
+    page_cache.invalidate('/artists', '/shows')
     flash('Artist {} was successfully updated!'.format(request.form.get('name')))
     
   except:
@@ -379,8 +378,8 @@ def edit_artist_submission(artist_id):
 
   return redirect(url_for('show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+  from forms import VenueForm
   form = VenueForm()
   data = {}
 
@@ -415,7 +414,6 @@ def edit_venue(venue_id):
   # *done
   return render_template('forms/edit_venue.html', form=form, venue=data)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # *done
   try:
@@ -438,8 +436,11 @@ def edit_venue_submission(venue_id):
 
 
     db.session.add(update_venue)
+    record_venue(update_venue)
     db.session.commit()
     db.session.refresh(update_venue)
+    bump_fragments('venue', venue_id)
+    page_cache.invalidate('/venues', '/shows')
     flash('Venue {} was successfully updated!'.format(request.form.get('name')))
     
   except:
@@ -454,12 +455,11 @@ def edit_venue_submission(venue_id):
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
 def create_artist_form():
+  from forms import ArtistForm
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   # called upon submitting the new artist listing form
   # *done
@@ -479,6 +479,7 @@ def create_artist_submission():
     db.session.add(new_artist)
     db.session.commit()
     db.session.refresh(new_artist)
+    page_cache.invalidate('/artists')
     flash('Artist {} was successfully listed!'.format(request.form.get('name')))
     
   except:
@@ -494,39 +495,44 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@read_only
+@page_cache.cached(ttl=30, stale_ttl=300)
+@conditional_get(shows_validator)
 def shows():
-  # displays list of shows at /shows
+  # displays list of shows at /shows, upcoming only unless ?from= is given
   # *done
-  shows = Show.query.all()
-
+  data = []
+  next_cursor = None
   try:
+    start = now()
+    end = None
+    if request.args.get('from'):
+      start = parse_date_bound(request.args['from'])
+    if request.args.get('to'):
+      end = parse_date_bound(request.args['to'], end=True)
+    key = ('shows', request.args.get('from'), request.args.get('to'), request.args.get('after'))
+    data, next_cursor = coalesced(
+      key,
+      lambda: show_listing(start, end, current_app.config['SHOWS_LISTING_PAGE_SIZE'], after=request.args.get('after'))
+    )
 
-    data=[]
-    for show in shows:
-      data.append({
-        'venue_id' : show.venue.id,
-        'venue_name' : show.venue.name,
-        'artist_id' : show.artist.id,
-        'artist_name' : show.artist.name,
-        'artist_image_link' : show.artist.image_link,
-        'start_time' : show.start_time
-      })
+  except ValueError:
+    flash('Invalid date range or page, showing upcoming shows instead.')
+    data, next_cursor = show_listing(now(), None, current_app.config['SHOWS_LISTING_PAGE_SIZE'])
 
   except:
     db.session.rollback()
     print(sys.exc_info())
     flash('something went wrong, please try again.')
 
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=data, next_cursor=next_cursor)
 
-@app.route('/shows/create')
 def create_shows():
   # renders form
+  from forms import ShowForm
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # *done
@@ -538,6 +544,9 @@ def create_show_submission():
     )
     db.session.add(show)
     db.session.commit()
+    fragments.bump('venue', show.venue_id)
+    fragments.bump('artist', show.artist_id)
+    page_cache.invalidate('/shows', '/venues')
     flash('Show was successfully listed!')
 
   except:
@@ -549,24 +558,59 @@ def create_show_submission():
     db.session.close()
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+#  Autocomplete
+#  ----------------------------------------------------------------
+
+@read_only
+def autocomplete():
+  kind = request.args.get('type', '')
+  if kind not in name_indexes.kinds:
+    return jsonify({'error': 'type must be one of: {}'.format(', '.join(name_indexes.kinds))}), 400
+  limit = min(request.args.get('limit', 10, type=int), 50)
+  data = lookup(kind, request.args.get('q', ''), limit, current_app.config['AUTOCOMPLETE_MAX_AGE'])
+  return jsonify({'data': data})
+
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Registration.
+#----------------------------------------------------------------------------#
+
+def register_views(app):
+  app.add_template_filter(format_datetime, 'datetime')
+  app.add_template_filter(format_datetimes, 'datetimes')
+  app.context_processor(inject_now)
+
+  app.add_url_rule('/', view_func=index)
+  app.add_url_rule('/venues', view_func=venues)
+  app.add_url_rule('/venues/search', view_func=search_venues, methods=['POST'])
+  app.add_url_rule('/venues/<int:venue_id>', view_func=show_venue)
+  app.add_url_rule('/venues/<int:venue_id>/shows', view_func=venue_shows)
+  app.add_url_rule('/venues/create', view_func=create_venue_form, methods=['GET'])
+  app.add_url_rule('/venues/create', view_func=create_venue_submission, methods=['POST'])
+  app.add_url_rule('/artists', view_func=artists)
+  app.add_url_rule('/artists/search', view_func=search_artists, methods=['POST'])
+  app.add_url_rule('/artists/<int:artist_id>', view_func=show_artist)
+  app.add_url_rule('/artists/<int:artist_id>/shows', view_func=artist_shows)
+  app.add_url_rule('/artists/<int:artist_id>/edit', view_func=edit_artist, methods=['GET'])
+  app.add_url_rule('/artists/<int:artist_id>/edit', view_func=edit_artist_submission, methods=['POST'])
+  app.add_url_rule('/venues/<int:venue_id>/edit', view_func=edit_venue, methods=['GET'])
+  app.add_url_rule('/venues/<int:venue_id>/edit', view_func=edit_venue_submission, methods=['POST'])
+  app.add_url_rule('/artists/create', view_func=create_artist_form, methods=['GET'])
+  app.add_url_rule('/artists/create', view_func=create_artist_submission, methods=['POST'])
+  app.add_url_rule('/shows', view_func=shows)
+  app.add_url_rule('/shows/create', view_func=create_shows)
+  app.add_url_rule('/shows/create', view_func=create_show_submission, methods=['POST'])
+  app.add_url_rule('/api/autocomplete', view_func=autocomplete)
+
+  app.register_error_handler(404, not_found_error)
+  app.register_error_handler(500, server_error)
+
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -579,6 +623,9 @@ if not app.debug:
 # Or specify port manually:
 
 if __name__ == '__main__':
+    # create_app imports this module as `app` for register_views; hand it this
+    # one instead of running the whole file a second time
+    sys.modules.setdefault('app', sys.modules[__name__])
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 
@@ -0,0 +1,204 @@
+'''In-process prefix index of artist and venue names.
+
+Each worker loads every (id, name) pair once and answers autocomplete
+lookups with a bisect over a sorted list, without touching Postgres.
+Commits made through this worker's session are applied as they happen;
+commits made by other workers are picked up when the index is older than
+AUTOCOMPLETE_MAX_AGE seconds. A stale index goes on answering while one
+background thread reloads it. The indexes belong to the app, in
+app.extensions, like the page and fragment caches.
+'''
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from models import Artist, Venue, db
+
+_models = {
+    'artist': Artist,
+    'venue': Venue,
+}
+
+
+class PrefixIndex(object):
+    '''Case-insensitive name prefix index over a sorted list.
+
+    Writers build a new (keys, names) pair and swap it in with a single
+    assignment, so readers never need a lock and never see one half of an
+    update without the other.
+    '''
+
+    def __init__(self):
+        self._entries = ([], {})
+        self._lock = threading.Lock()
+        self.loaded_at = None
+
+    def load(self, rows):
+        keys = sorted((name.casefold(), id) for id, name in rows)
+        names = dict(rows)
+        with self._lock:
+            self._entries = (keys, names)
+            self.loaded_at = time.monotonic()
+
+    def put(self, id, name):
+        with self._lock:
+            keys, names = self._entries
+            keys = [key for key in keys if key[1] != id]
+            insort(keys, (name.casefold(), id))
+            names = dict(names)
+            names[id] = name
+            self._entries = (keys, names)
+
+    def discard(self, id):
+        with self._lock:
+            keys, names = self._entries
+            keys = [key for key in keys if key[1] != id]
+            names = dict(names)
+            names.pop(id, None)
+            self._entries = (keys, names)
+
+    def search(self, prefix, limit=10):
+        keys, names = self._entries
+        prefix = prefix.casefold()
+        results = []
+        i = bisect_left(keys, (prefix,))
+        while i < len(keys) and len(results) < limit:
+            key, id = keys[i]
+            if not key.startswith(prefix):
+                break
+            results.append({'id': id, 'name': names[id]})
+            i += 1
+        return results
+
+
+class IndexStore(object):
+    '''One app's name indexes and the kinds being reloaded in the background.'''
+
+    def __init__(self):
+        self.indexes = {kind: PrefixIndex() for kind in _models}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+        # held while an index that was never loaded is built, so the first
+        # requests of a cold worker wait for one load instead of each running it
+        self.load_lock = threading.Lock()
+
+
+class NameIndexes(object):
+    '''Autocomplete extension; each app's indexes live in app.extensions.'''
+
+    kinds = tuple(sorted(_models))
+
+    def init_app(self, app):
+        app.extensions['autocomplete'] = IndexStore()
+
+    @property
+    def state(self):
+        return current_app.extensions['autocomplete']
+
+
+name_indexes = NameIndexes()
+
+
+def _rows(kind):
+    model = _models[kind]
+    return db.session.query(model.id, model.name).all()
+
+
+def _load(kind):
+    name_indexes.state.indexes[kind].load(_rows(kind))
+
+
+def build_indexes():
+    '''Load every artist and venue name.'''
+    for kind in _models:
+        _load(kind)
+
+
+def ensure_indexes():
+    '''Build the indexes not loaded yet, e.g. in a worker forked from a warmed master.'''
+    state = name_indexes.state
+    for kind in _models:
+        if state.indexes[kind].loaded_at is None:
+            with state.load_lock:
+                if state.indexes[kind].loaded_at is None:
+                    _load(kind)
+
+
+def lookup(kind, prefix, limit, max_age):
+    '''Search one index. A stale index keeps answering while one background
+    thread reloads it; only an index that was never loaded is built inline.'''
+    state = name_indexes.state
+    index = state.indexes[kind]
+    if index.loaded_at is None:
+        ensure_indexes()
+    elif time.monotonic() - index.loaded_at > max_age:
+        _reload_in_background(state, kind)
+    return index.search(prefix, limit)
+
+
+def _reload_in_background(state, kind):
+    with state.lock:
+        if kind in state.refreshing:
+            return
+        state.refreshing.add(kind)
+
+    app = current_app._get_current_object()
+
+    def reload():
+        try:
+            with app.app_context():
+                try:
+                    _load(kind)
+                finally:
+                    db.session.remove()
+        except Exception:
+            app.logger.exception('autocomplete reload failed for %s', kind)
+        finally:
+            with state.lock:
+                state.refreshing.discard(kind)
+
+    threading.Thread(target=reload, daemon=True).start()
+
+
+def _kind_of(obj):
+    if isinstance(obj, Artist):
+        return 'artist'
+    if isinstance(obj, Venue):
+        return 'venue'
+    return None
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault('autocomplete', [])
+    for obj in list(session.new) + list(session.dirty):
+        kind = _kind_of(obj)
+        if kind is not None:
+            pending.append((kind, obj.id, obj.name))
+    for obj in session.deleted:
+        kind = _kind_of(obj)
+        if kind is not None:
+            pending.append((kind, obj.id, None))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_changes(session):
+    changes = session.info.pop('autocomplete', [])
+    if not changes or not has_app_context():
+        return
+    indexes = name_indexes.state.indexes
+    for kind, id, name in changes:
+        if indexes[kind].loaded_at is None:
+            continue
+        if name is None:
+            indexes[kind].discard(id)
+        else:
+            indexes[kind].put(id, name)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_changes(session):
+    session.info.pop('autocomplete', None)
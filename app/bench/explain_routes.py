@@ -0,0 +1,109 @@
+'''Capture EXPLAIN ANALYZE for every query each route issues.
+
+Run it against a seeded database before and after `flask db upgrade` and
+diff the two reports:
+
+    python bench/seed.py
+    python bench/explain_routes.py > before.txt
+    flask db upgrade
+    python bench/explain_routes.py > after.txt
+
+Each route is requested through the test client while the engine records
+its SELECT statements; every statement is then replayed under
+EXPLAIN (ANALYZE, BUFFERS) with its original parameters.
+'''
+import argparse
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from factory import create_app  # noqa: E402
+from models import Artist, Venue, Show, db  # noqa: E402
+
+EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+def busiest(column):
+    return db.session.query(column).group_by(column).order_by(
+        db.func.count().desc()).limit(1).scalar()
+
+
+def routes():
+    venue_id = busiest(Show.venue_id) or 1
+    artist_id = busiest(Show.artist_id) or 1
+    term = db.session.query(Venue.name).limit(1).scalar() or 'a'
+    return [
+        ('GET', '/venues', None),
+        ('POST', '/venues/search', {'search_term': term.split()[0]}),
+        ('GET', '/venues/{}'.format(venue_id), None),
+        ('GET', '/venues/{}/shows?kind=past'.format(venue_id), None),
+        ('GET', '/artists', None),
+        ('POST', '/artists/search', {'search_term': term.split()[-1]}),
+        ('GET', '/artists/{}'.format(artist_id), None),
+        ('GET', '/artists/{}/shows?kind=past'.format(artist_id), None),
+        ('GET', '/shows', None),
+    ]
+
+
+def capture(client, method, path, form):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        client.open(path, method=method, data=form)
+    except Exception as e:
+        # Rendering may fail on a bare checkout; the queries already ran.
+        print('-- {} {} raised {!r}'.format(method, path, e))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def explain(statement, parameters):
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            'EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters).fetchall()
+    return [row[0] for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--summary-only', action='store_true',
+                        help='print only the per-route totals')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    client.get('/')  # run before_first_request hooks outside the capture
+
+    totals = []
+    with app.app_context():
+        for method, path, form in routes():
+            statements = capture(client, method, path, form)
+            total = 0.0
+            for statement, parameters in statements:
+                plan = explain(statement, parameters)
+                total += sum(float(m.group(1)) for m in map(EXECUTION_TIME.search, plan) if m)
+                if not args.summary_only:
+                    print('=== {} {}'.format(method, path))
+                    print(statement)
+                    print('\n'.join(plan))
+                    print()
+            totals.append((method, path, len(statements), total))
+
+    print('{:<6} {:<40} {:>8} {:>12}'.format('method', 'route', 'queries', 'exec ms'))
+    for method, path, count, total in totals:
+        print('{:<6} {:<40} {:>8} {:>12.3f}'.format(method, path, count, total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''Check that listing pages issue as many queries for 1 venue as for N.
+
+    FYYUR_CONFIG=testing flask db upgrade
+    python bench/query_counts.py --venues 500
+
+Runs against the testing profile's database (TEST_DATABASE_URL), which it
+empties first. Each route is requested once with a single venue, artist
+and show, and again after the catalogue has grown to --venues venues; the
+per-request counts come from the X-Query-Count header (see querystats.py).
+The testing profile also raises QueryBudgetExceeded when a route runs past
+its budget or repeats a statement. The script exits non-zero if any count
+grows with the catalogue or a budget is exceeded.
+'''
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from factory import create_app  # noqa: E402
+from models import db  # noqa: E402
+from querystats import QueryBudgetExceeded  # noqa: E402
+from seed import seed  # noqa: E402
+
+ROUTES = ['/venues', '/artists', '/shows']
+
+
+def query_counts(client):
+    counts = {}
+    for path in ROUTES:
+        try:
+            counts[path] = int(client.get(path).headers['X-Query-Count'])
+        except QueryBudgetExceeded as e:
+            print('-- {}'.format(e))
+            counts[path] = None
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=500)
+    parser.add_argument('--random-seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    client = app.test_client()
+    rng = random.Random(args.random_seed)
+    with app.app_context():
+        db.session.execute(db.text(
+            'TRUNCATE shows, venue_area_summary, venues, artists RESTART IDENTITY CASCADE'))
+        db.session.commit()
+        seed(1, 1, 1, rng)
+        client.get('/')  # run before_first_request hooks outside the counts
+        small = query_counts(client)
+        seed(args.venues - 1, args.venues * 4, args.venues * 40, rng)
+        large = query_counts(client)
+
+    print('{:<10} {:>10} {:>10}'.format('route', '1 venue', '{} venues'.format(args.venues)))
+    failed = False
+    for path in ROUTES:
+        print('{:<10} {:>10} {:>10}'.format(path, str(small[path]), str(large[path])))
+        failed = failed or small[path] is None or small[path] != large[path]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+'''Fill the configured database with a synthetic catalogue for benchmarks.
+
+    python bench/seed.py --venues 5000 --artists 20000 --shows 200000
+
+Rows are appended to whatever is already there; point SQLALCHEMY_DATABASE_URI
+at a throwaway database.
+'''
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Artist, Venue, Show, db  # noqa: E402
+from counters import repair_drift  # noqa: E402
+from factory import create_app  # noqa: E402
+from summary import rebuild  # noqa: E402
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+    ('Brooklyn', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'),
+    ('Chicago', 'IL'), ('Seattle', 'WA'), ('Portland', 'OR'),
+    ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO'),
+]
+GENRES = ['Jazz', 'Blues', 'Rock n Roll', 'Folk', 'Soul', 'Hip-Hop', 'Pop']
+WORDS = [
+    'Blue', 'Velvet', 'Hop', 'Square', 'Piano', 'Moon', 'Echo', 'Lantern',
+    'Harbor', 'Garden', 'Static', 'Golden', 'Basement', 'Dueling', 'Room',
+]
+BATCH = 5000
+
+
+def _name(rng):
+    return ' '.join(rng.sample(WORDS, 3))
+
+
+def _insert(table, rows):
+    for i in range(0, len(rows), BATCH):
+        db.session.execute(table.insert(), rows[i:i + BATCH])
+
+
+def seed(venues, artists, shows, rng):
+    venue_start = (db.session.query(db.func.max(Venue.id)).scalar() or 0) + 1
+    artist_start = (db.session.query(db.func.max(Artist.id)).scalar() or 0) + 1
+
+    venue_rows = []
+    for id in range(venue_start, venue_start + venues):
+        city, state = rng.choice(CITIES)
+        venue_rows.append({
+            'id': id, 'name': _name(rng), 'city': city, 'state': state,
+            'address': '{} Main St'.format(id), 'phone': '555-0100',
+            'genres': rng.sample(GENRES, 2), 'seeking_talent': False,
+        })
+    _insert(Venue.__table__, venue_rows)
+
+    artist_rows = []
+    for id in range(artist_start, artist_start + artists):
+        city, state = rng.choice(CITIES)
+        artist_rows.append({
+            'id': id, 'name': _name(rng), 'city': city, 'state': state,
+            'phone': '555-0199', 'genres': rng.sample(GENRES, 2),
+            'seeking_venue': False,
+        })
+    _insert(Artist.__table__, artist_rows)
+
+    now = datetime.today()
+    show_rows = [
+        {
+            'venue_id': rng.randrange(venue_start, venue_start + venues),
+            'artist_id': rng.randrange(artist_start, artist_start + artists),
+            'start_time': now + timedelta(hours=rng.randint(-24 * 730, 24 * 180)),
+        }
+        for _ in range(shows)
+    ]
+    _insert(Show.__table__, show_rows)
+
+    for table in ('venues', 'artists'):
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+            "(SELECT max(id) FROM {0}))".format(table)))
+    db.session.commit()
+    rebuild()
+    repair_drift(now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=5000)
+    parser.add_argument('--artists', type=int, default=20000)
+    parser.add_argument('--shows', type=int, default=200000)
+    parser.add_argument('--random-seed', type=int, default=1)
+    args = parser.parse_args()
+    with create_app().app_context():
+        seed(args.venues, args.artists, args.shows, random.Random(args.random_seed))
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
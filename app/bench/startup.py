@@ -0,0 +1,68 @@
+'''Measure cold-start time of the app in fresh interpreters.
+
+    python bench/startup.py --runs 10 --top 15
+
+Each scenario runs in a new Python process, so nothing is cached in
+sys.modules. The script prints min and median wall time per scenario,
+followed by the slowest top-level imports of `create_app()` according to
+`python -X importtime`. Run it before and after a change that touches
+imports to catch a heavy module creeping back into startup.
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = [
+    ('import models', 'import models'),
+    ('create_app()', 'from factory import create_app; create_app()'),
+    ('create_app() + CLI', 'import flask_migrate; from factory import create_app; create_app()'),
+]
+
+
+def run(code, *flags):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable] + list(flags) + ['-c', code],
+        cwd=APP_DIR, capture_output=True, text=True, check=True,
+    )
+    return time.perf_counter() - started, result.stderr
+
+
+def slowest_imports(code, top):
+    '''Return (cumulative ms, module) for the slowest top-level imports.'''
+    _, stderr = run(code, '-X', 'importtime')
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # two spaces of indent per nesting level; keep direct imports only
+        if len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative) / 1000.0, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    print('{:<24} {:>9} {:>9}'.format('scenario', 'min ms', 'median ms'))
+    for label, code in SCENARIOS:
+        times = [run(code)[0] * 1000 for _ in range(args.runs)]
+        print('{:<24} {:>9.1f} {:>9.1f}'.format(label, min(times), statistics.median(times)))
+
+    print()
+    print('slowest imports of create_app():')
+    for ms, name in slowest_imports(SCENARIOS[1][1], args.top):
+        print('{:>9.1f} ms  {}'.format(ms, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+'''Versioned fragment cache for rendered venue and artist pages.
+
+Entries are keyed by entity kind, id, a per-entity version number and a
+variant (the locale). Write handlers bump the version, which orphans every
+cached copy of the entity at once; orphans simply age out of the LRU.
+
+The in-process LRU tier is always on. Setting FRAGMENT_CACHE_REDIS_URL
+adds a shared tier (needs the optional `redis` package) that also holds
+the version numbers, so a bump in one worker invalidates all of them.
+Without it each worker keeps its own versions and other workers catch up
+within FRAGMENT_CACHE_TTL seconds.
+'''
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class LRUCache(object):
+    '''Thread-safe LRU mapping whose entries also expire after `ttl` seconds.'''
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisTier(object):
+    '''Shared cache tier backed by Redis.'''
+
+    def __init__(self, url, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+class FragmentStore(object):
+    '''One app's fragment tiers and, without Redis, its version numbers.'''
+
+    def __init__(self, config):
+        self.ttl = config['FRAGMENT_CACHE_TTL']
+        self.local = LRUCache(config['FRAGMENT_CACHE_SIZE'], self.ttl)
+        self.shared = None
+        if config.get('FRAGMENT_CACHE_REDIS_URL'):
+            self.shared = RedisTier(config['FRAGMENT_CACHE_REDIS_URL'])
+        self.versions = {}
+        self.lock = threading.Lock()
+
+
+class FragmentCache(object):
+    '''Fragment cache extension; each app's state lives in app.extensions.'''
+
+    def init_app(self, app):
+        app.extensions['fragments'] = FragmentStore(app.config)
+
+    @property
+    def state(self):
+        return current_app.extensions['fragments']
+
+    def version(self, kind, id):
+        state = self.state
+        if state.shared is not None:
+            return int(state.shared.get('version:{}:{}'.format(kind, id)) or 0)
+        return state.versions.get((kind, id), 0)
+
+    def bump(self, kind, id):
+        '''Invalidate every cached fragment of one entity.'''
+        state = self.state
+        if state.shared is not None:
+            state.shared.incr('version:{}:{}'.format(kind, id))
+        else:
+            with state.lock:
+                state.versions[(kind, id)] = state.versions.get((kind, id), 0) + 1
+
+    def _key(self, kind, id, version, variant):
+        return 'fragment:{}:{}:{}:{}'.format(kind, id, version, variant)
+
+    def get(self, kind, id, variant=''):
+        '''Return (fragment or None, version).
+
+        Pass the version back to `set` with the page built after a miss. If
+        the entity is bumped while the page renders, it is then filed under
+        the old version, where nobody looks any more.
+        '''
+        state = self.state
+        version = self.version(kind, id)
+        key = self._key(kind, id, version, variant)
+        value = state.local.get(key)
+        if value is None and state.shared is not None:
+            value = state.shared.get(key)
+            if value is not None:
+                state.local.set(key, value)
+        return value, version
+
+    def set(self, kind, id, value, version, variant=''):
+        state = self.state
+        key = self._key(kind, id, version, variant)
+        state.local.set(key, value)
+        if state.shared is not None:
+            state.shared.set(key, value, state.ttl)
+
+
+fragments = FragmentCache()
@@ -0,0 +1,22 @@
+'''One "now" per request.
+
+Views, queries and template filters all compare against `now()`, which is
+read once per application context (so once per request or CLI command)
+and can be pinned with the FROZEN_NOW config key to make pages
+deterministic in tests and benchmarks.
+'''
+from datetime import datetime
+
+from flask import current_app, g, has_app_context
+
+
+def now():
+    '''Return the current time, fixed for the rest of the app context.'''
+    if not has_app_context():
+        return datetime.today()
+    if 'now' not in g:
+        frozen = current_app.config.get('FROZEN_NOW')
+        if isinstance(frozen, str):
+            frozen = datetime.fromisoformat(frozen)
+        g.now = frozen or datetime.today()
+    return g.now
@@ -1,15 +1,173 @@
+'''Configuration profiles, selected with FYYUR_CONFIG (development, testing
+or production; development by default).
+
+Deployment-specific values come from the environment so one build can run
+anywhere: DATABASE_URL, DATABASE_REPLICA_URLS, SECRET_KEY, the DB_* pool
+settings and the cache URLs. Production refuses to start without a
+SECRET_KEY, since every worker must sign sessions and CSRF tokens with the
+same key.
+'''
 import os
-SECRET_KEY = os.urandom(32)
+
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
 
-# Connect to the database
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def _fix_scheme(url):
+    # Heroku still hands out the postgres:// scheme SQLAlchemy 1.4 dropped.
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _database_url(default):
+    return _fix_scheme(os.environ.get('DATABASE_URL', default))
+
+
+def _replica_binds():
+    '''SQLALCHEMY_BINDS entries for the comma-separated DATABASE_REPLICA_URLS.'''
+    urls = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')]
+    return {
+        'replica_{}'.format(i): _fix_scheme(url)
+        for i, url in enumerate(url for url in urls if url)
+    }
+
+
+def engine_options(url):
+    '''Connection pool settings for SQLALCHEMY_ENGINE_OPTIONS, tunable per deployment.
+
+    Size the pool so that workers * threads fits in DB_POOL_SIZE +
+    DB_MAX_OVERFLOW per process, and the total across processes stays
+    under the server's max_connections.
+    '''
+    if url.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        # Recycle before the server or a proxy drops idle connections.
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+    statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout and url.startswith('postgresql'):
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(statement_timeout)
+        }
+    return options
+
+
+class Config(object):
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
+
+    DEBUG = False
+
+    #* done
+    SQLALCHEMY_DATABASE_URI = _database_url('postgresql://postgres:@localhost:5432/fyyur')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Read replicas for GET requests (see routing.py). Replicas further
+    # behind than REPLICA_MAX_LAG seconds are skipped, and visitors who
+    # just wrote read from the primary for READ_YOUR_WRITES_SECONDS.
+    SQLALCHEMY_BINDS = _replica_binds()
+    REPLICA_MAX_LAG = _env_int('REPLICA_MAX_LAG', 5)
+    REPLICA_CHECK_INTERVAL = 5
+    READ_YOUR_WRITES_SECONDS = _env_int('READ_YOUR_WRITES_SECONDS', 15)
+
+    # Maximum number of rows returned by the venue and artist searches.
+    SEARCH_RESULTS_LIMIT = 50
+
+    # Seconds before a worker reloads its autocomplete index to pick up
+    # artists and venues created by other workers.
+    AUTOCOMPLETE_MAX_AGE = 300
+
+    # Shows per page in the past/upcoming blocks of venue and artist pages.
+    SHOWS_PAGE_SIZE = 10
+
+    # Shows per page on the /shows listing.
+    SHOWS_LISTING_PAGE_SIZE = 50
+
+    # Pin the request clock (a datetime or ISO 8601 string) so pages render
+    # deterministically in tests and benchmarks. None uses the real time.
+    FROZEN_NOW = os.environ.get('FROZEN_NOW')
+
+    # Locales dates can be rendered in, negotiated from Accept-Language. The
+    # first one is the fallback.
+    LANGUAGES = ['en', 'fr', 'de', 'es', 'it', 'pt', 'nl']
+
+    # Rendered venue and artist pages are cached per entity version and locale.
+    FRAGMENT_CACHE_SIZE = _env_int('FRAGMENT_CACHE_SIZE', 2048)
+    FRAGMENT_CACHE_TTL = 300
+    # Optional shared tier (requires the redis package), e.g. redis://localhost:6379/0
+    FRAGMENT_CACHE_REDIS_URL = os.environ.get('FRAGMENT_CACHE_REDIS_URL')
+
+    # Whole-page cache for anonymous GETs of /, /venues, /artists and /shows.
+    PAGE_CACHE_ENABLED = True
+    PAGE_CACHE_SIZE = _env_int('PAGE_CACHE_SIZE', 512)
+
+    # Seconds a request waits for an identical in-flight page build before
+    # building the page itself.
+    SINGLE_FLIGHT_TIMEOUT = 5
+
+    # Per-request SQL counts and timings in X-Query-* headers and the log
+    # (see querystats.py). Requests running more than QUERY_BUDGET
+    # statements, or one statement shape more than QUERY_REPEAT_LIMIT times,
+    # log a warning, or raise QueryBudgetExceeded with QUERY_BUDGET_RAISE.
+    QUERY_STATS_ENABLED = _env_bool('QUERY_STATS_ENABLED', True)
+    QUERY_BUDGET = _env_int('QUERY_BUDGET', 30)
+    QUERY_REPEAT_LIMIT = _env_int('QUERY_REPEAT_LIMIT', 5)
+    QUERY_BUDGET_RAISE = False
+
+
+class DevelopmentConfig(Config):
+    # Enable debug mode.
+    DEBUG = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    PAGE_CACHE_ENABLED = False
+    QUERY_BUDGET_RAISE = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'TEST_DATABASE_URL', 'postgresql://postgres:@localhost:5432/fyyur_test')
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+
+
+class ProductionConfig(Config):
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    # Templates only change on deploy; skip the per-render mtime checks.
+    TEMPLATES_AUTO_RELOAD = False
+    SESSION_COOKIE_SECURE = _env_bool('SESSION_COOKIE_SECURE', True)
+    # Query timings are for developers, not the public.
+    QUERY_STATS_ENABLED = _env_bool('QUERY_STATS_ENABLED', False)
+
 
+profiles = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
 
-#* done
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres:@localhost:5432/fyyur'
 
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+def load(name=None):
+    '''Return the config class named by `name` or FYYUR_CONFIG.'''
+    name = name or os.environ.get('FYYUR_CONFIG', 'development')
+    try:
+        profile = profiles[name]
+    except KeyError:
+        raise RuntimeError('FYYUR_CONFIG must be one of: {}'.format(', '.join(sorted(profiles))))
+    if not profile.SECRET_KEY:
+        raise RuntimeError('SECRET_KEY must be set in the {} profile'.format(name))
+    return profile
@@ -0,0 +1,123 @@
+'''Denormalised upcoming_shows_count columns on venues and artists.
+
+Show inserts and deletes adjust both counters in the same transaction.
+Counters only go stale as booked shows pass into the past, which
+`flask counters rollover` catches up on; `flask counters check` compares
+every counter with the shows table and can repair any drift. The /venues
+listing reads the venue counter too (see summary.py).
+
+A show counts as upcoming from now on, `start_time >= now`, the same test
+the detail pages and the freshness validators use.
+'''
+from datetime import timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event
+
+from clock import now
+from models import Artist, Venue, Show, db
+
+counters_cli = AppGroup('counters', help='Maintain upcoming show counters.')
+
+_counted = (
+    (Venue, Show.venue_id, 'venue_id'),
+    (Artist, Show.artist_id, 'artist_id'),
+)
+
+
+def _adjust(connection, show, delta):
+    if show.start_time < now():
+        return
+    for model, _, attr in _counted:
+        connection.execute(
+            db.update(model.__table__).where(
+                model.__table__.c.id == getattr(show, attr)
+            ).values(
+                upcoming_shows_count=model.__table__.c.upcoming_shows_count + delta
+            )
+        )
+
+
+@event.listens_for(Show, 'after_insert')
+def _show_inserted(mapper, connection, show):
+    _adjust(connection, show, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _show_deleted(mapper, connection, show):
+    _adjust(connection, show, -1)
+
+
+def _actual_count(model, fk, now):
+    return db.session.query(db.func.count(Show.id)).filter(
+        fk == model.id, Show.start_time >= now
+    ).correlate(model).scalar_subquery()
+
+
+def rollover(now, window):
+    '''Recount the entities that had a show start in [now - window, now).
+
+    The recount is idempotent, so overlapping runs are harmless; `window`
+    only has to cover the time since the previous run.
+    '''
+    updated = 0
+    for model, fk, _ in _counted:
+        passed = db.session.query(fk).filter(
+            Show.start_time >= now - window, Show.start_time < now
+        )
+        updated += db.session.query(model).filter(
+            model.id.in_(passed)
+        ).update(
+            {model.upcoming_shows_count: _actual_count(model, fk, now)},
+            synchronize_session=False
+        )
+    db.session.commit()
+    return updated
+
+
+def drift(now):
+    '''Yield (model, id, stored, actual) for every counter that is wrong.'''
+    for model, fk, _ in _counted:
+        actual = _actual_count(model, fk, now)
+        rows = db.session.query(
+            model.id, model.upcoming_shows_count, actual
+        ).filter(model.upcoming_shows_count != actual)
+        for id, stored, count in rows:
+            yield model, id, stored, count
+
+
+def repair_drift(now):
+    '''Overwrite every drifted counter with a fresh count in one UPDATE each.'''
+    for model, fk, _ in _counted:
+        actual = _actual_count(model, fk, now)
+        db.session.query(model).filter(
+            model.upcoming_shows_count != actual
+        ).update(
+            {model.upcoming_shows_count: actual}, synchronize_session=False
+        )
+    db.session.commit()
+
+
+@counters_cli.command('rollover')
+@click.option('--window-hours', default=24, show_default=True,
+              help='How far back to look for shows that have started.')
+def rollover_command(window_hours):
+    '''Catch counters up with shows that moved into the past.'''
+    updated = rollover(now(), timedelta(hours=window_hours))
+    click.echo('{} counters recounted'.format(updated))
+
+
+@counters_cli.command('check')
+@click.option('--repair', is_flag=True, help='Overwrite drifted counters.')
+def check_command(repair):
+    '''Report counters that disagree with the shows table.'''
+    checked_at = now()
+    found = list(drift(checked_at))
+    for model, id, stored, actual in found:
+        click.echo('{} {}: stored {}, actual {}'.format(
+            model.__tablename__, id, stored, actual))
+    if repair:
+        repair_drift(checked_at)
+    click.echo('{} counters drifted{}'.format(
+        len(found), ', repaired' if repair and found else ''))
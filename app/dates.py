@@ -0,0 +1,126 @@
+'''Date formatting for the `datetime` and `datetimes` Jinja filters.
+
+Dates render in the locale negotiated from the request's Accept-Language
+header among the configured LANGUAGES. Named formats resolve to a compiled
+babel pattern per locale, and locale names to a babel Locale, once per
+process (`preload_locales` does it at startup); string dates parsed with
+dateutil are memoised too. Formatting a show's start time is then a
+single pattern application whatever the language. babel and dateutil are
+imported on first use to keep them out of startup.
+'''
+from functools import lru_cache
+
+from flask import current_app, g, has_request_context, request
+from werkzeug.datastructures import LanguageAccept
+from werkzeug.http import parse_accept_header
+
+from clock import now
+
+# House style for English. Other locales use their own CLDR date and
+# short time formats, joined the way the locale joins them.
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# Named formats, as babel.dates.format_datetime accepts them; any other
+# format string is a CLDR pattern. 'short' and 'long' are the locale's own
+# in every language, including English.
+NAMED_FORMATS = ('full', 'long', 'medium', 'short')
+
+
+@lru_cache(maxsize=32)
+def get_locale(name):
+    from babel import Locale
+    return Locale.parse(name)
+
+
+def _locale_pattern(format, locale):
+    if format in FORMATS and locale.language == 'en':
+        return FORMATS[format]
+    time_format = 'short' if format in FORMATS else format
+    return locale.datetime_formats[format].replace(
+        '{1}', locale.date_formats[format].pattern
+    ).replace(
+        '{0}', locale.time_formats[time_format].pattern
+    )
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(format, locale='en'):
+    if format in NAMED_FORMATS:
+        format = _locale_pattern(format, get_locale(locale))
+    import babel.dates
+    return babel.dates.parse_pattern(format)
+
+
+def preload_locales(names):
+    '''Load locale data and compile the named formats for every language.'''
+    for name in names:
+        for format in FORMATS:
+            compile_pattern(format, name)
+
+
+@lru_cache(maxsize=1024)
+def negotiate_locale(header, supported):
+    '''Pick the best supported locale for an Accept-Language header.
+
+    Tags are tried in quality order, each as given and then by its primary
+    language, so `fr-CA, en;q=0.5` picks 'fr' when only 'fr' and 'en' exist.
+    '''
+    for tag, _ in parse_accept_header(header, LanguageAccept):
+        tag = tag.replace('_', '-').lower()
+        for candidate in (tag, tag.split('-')[0]):
+            if candidate in supported:
+                return candidate
+    return supported[0]
+
+
+def current_locale():
+    '''Return the locale for this request, negotiated once and kept on g.'''
+    if not has_request_context():
+        return 'en'
+    if 'locale' not in g:
+        g.locale = negotiate_locale(
+            request.headers.get('Accept-Language', ''),
+            tuple(current_app.config['LANGUAGES'])
+        )
+    return g.locale
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value):
+    import dateutil.parser
+    return dateutil.parser.parse(value)
+
+
+def format_datetime(value, format='medium', locale=None):
+    locale = locale or current_locale()
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if format == 'relative':
+        import babel.dates
+        return babel.dates.format_timedelta(
+            value - now(), add_direction=True, locale=get_locale(locale))
+    return compile_pattern(format, locale).apply(value, get_locale(locale))
+
+
+def format_datetimes(values, format='medium', locale=None):
+    '''Format a whole list of dates at once, e.g. every show on a page.
+
+    Pattern and locale are looked up once for the batch, and repeated
+    values (shows sharing a start time) are only formatted once.
+    '''
+    locale = locale or current_locale()
+    if format == 'relative':
+        return [format_datetime(value, format, locale) for value in values]
+    pattern = compile_pattern(format, locale)
+    babel_locale = get_locale(locale)
+    formatted = {}
+    results = []
+    for value in values:
+        if value not in formatted:
+            date = parse_datetime(value) if isinstance(value, str) else value
+            formatted[value] = pattern.apply(date, babel_locale)
+        results.append(formatted[value])
+    return results
@@ -0,0 +1,106 @@
+'''Streaming exports of every show with its venue and artist names.
+
+    GET /export/shows.csv
+    GET /export/shows.jsonl
+    flask export-shows --format csv --output shows.csv
+
+Rows come from a server-side cursor (`yield_per`) and are written out in
+chunks as they arrive. Memory use therefore stays flat however large the
+shows table is.
+'''
+import csv
+import io
+import json
+import sys
+
+import click
+from flask import Blueprint, Response, stream_with_context
+from flask.cli import with_appcontext
+
+from models import Artist, Venue, Show, db
+from routing import read_only
+
+export = Blueprint('export', __name__, url_prefix='/export')
+
+COLUMNS = ('id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name')
+BATCH_SIZE = 1000
+
+
+def show_rows(batch_size=BATCH_SIZE):
+    '''Yield (id, start_time, venue_id, venue_name, artist_id, artist_name) in id order.'''
+    query = db.session.query(
+        Show.id, Show.start_time, Venue.id, Venue.name, Artist.id, Artist.name,
+    ).join(
+        Venue, Show.venue_id == Venue.id
+    ).join(
+        Artist, Show.artist_id == Artist.id
+    ).order_by(
+        Show.id
+    ).yield_per(batch_size)
+    for row in query:
+        yield (row[0], row[1].isoformat()) + tuple(row[2:])
+
+
+def _chunks(rows, write_rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield write_rows(batch)
+            batch = []
+    if batch:
+        yield write_rows(batch)
+
+
+def csv_chunks(rows, batch_size=BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def write_rows(batch):
+        writer.writerows(batch)
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    yield write_rows([COLUMNS])
+    yield from _chunks(rows, write_rows, batch_size)
+
+
+def jsonl_chunks(rows, batch_size=BATCH_SIZE):
+    def write_rows(batch):
+        return ''.join(json.dumps(dict(zip(COLUMNS, row))) + '\n' for row in batch)
+
+    yield from _chunks(rows, write_rows, batch_size)
+
+
+formats = {
+    'csv': (csv_chunks, 'text/csv'),
+    'jsonl': (jsonl_chunks, 'application/x-ndjson'),
+}
+
+
+@export.route('/shows.<any(csv, jsonl):format>')
+@read_only
+def export_shows(format):
+    chunks, mimetype = formats[format]
+    response = Response(stream_with_context(chunks(show_rows())), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=shows.{}'.format(format)
+    return response
+
+
+@click.command('export-shows')
+@click.option('--format', 'format', type=click.Choice(sorted(formats)), default='csv')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True),
+              help='File to write to; defaults to standard output.')
+@with_appcontext
+def export_shows_command(format, output):
+    '''Write every show with venue and artist names as CSV or JSON lines.'''
+    chunks, _ = formats[format]
+    out = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        for chunk in chunks(show_rows()):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
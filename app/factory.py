@@ -0,0 +1,86 @@
+'''Application factory.
+
+    from factory import create_app
+    app = create_app('testing')
+
+Modules no longer build a global app at import time. Extensions are plain
+objects (`db`, `fragments`, `page_cache`, `query_counter`, `name_indexes`)
+bound to each app here; their per-app state lives in `app.extensions`, and
+`app.register_views` adds the routes, template filters and error handlers
+of app.py to every app create_app builds. Modules that are slow to import
+and only some entry points need are loaded on first use: alembic for
+`flask db`, WTForms for the form views and the importer, and flask_moment
+for template rendering.
+'''
+import logging
+import sys
+from logging import FileHandler, Formatter
+
+from flask import Flask
+
+import config as config_profiles
+
+
+def _inject_moment():
+    # flask_moment imports distutils, the slowest import of the whole app;
+    # only templates need it, so load it on the first render.
+    from flask_moment import moment
+    return {'moment': moment}
+
+
+def create_app(config=None):
+    '''Build an app from a config profile name, a config object, or FYYUR_CONFIG.'''
+    if config is None or isinstance(config, str):
+        config = config_profiles.load(config)
+
+    app = Flask('app')
+    app.config.from_object(config)
+
+    from models import db
+    from cache import fragments
+    from page_cache import page_cache
+    from querystats import query_counter
+    from autocomplete import name_indexes
+    db.init_app(app)
+    fragments.init_app(app)
+    page_cache.init_app(app)
+    query_counter.init_app(app)
+    name_indexes.init_app(app)
+    app.context_processor(_inject_moment)
+
+    # The `flask` command loads flask_migrate as a plugin before it creates
+    # the app; web workers never need alembic, so only wire it up then.
+    if 'flask_migrate' in sys.modules:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    from app import register_views
+    register_views(app)
+
+    from api import api
+    from export import export, export_shows_command
+    from autocomplete import ensure_indexes
+    from counters import counters_cli
+    from dates import preload_locales
+    from importer import import_command
+    from summary import summary_cli
+    app.register_blueprint(api)
+    app.register_blueprint(export)
+    app.cli.add_command(summary_cli)
+    app.cli.add_command(counters_cli)
+    app.cli.add_command(export_shows_command)
+    app.cli.add_command(import_command)
+    app.before_first_request(ensure_indexes)
+    app.before_first_request(lambda: preload_locales(app.config['LANGUAGES']))
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    return app
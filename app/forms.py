@@ -1,19 +1,22 @@
 from datetime import datetime
+from clock import now
 from flask_wtf import Form
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
 from wtforms.validators import DataRequired, AnyOf, URL
 
 class ShowForm(Form):
     artist_id = StringField(
-        'artist_id'
+        'artist_id',
+        render_kw={'data-autocomplete': '/api/autocomplete?type=artist'}
     )
     venue_id = StringField(
-        'venue_id'
+        'venue_id',
+        render_kw={'data-autocomplete': '/api/autocomplete?type=venue'}
     )
     start_time = DateTimeField(
         'start_time',
         validators=[DataRequired()],
-        default= datetime.today()
+        default=now
     )
 
 class VenueForm(Form):
@@ -0,0 +1,177 @@
+'''updated_at propagation and conditional GET for entity and listing pages.
+
+Every page has a validator: one aggregate query returning the newest
+updated_at among the rows the page shows, plus whatever else can change
+the page without a write (the number of upcoming shows, which drops as
+shows pass). `conditional_get` turns that into an ETag and Last-Modified
+and answers If-None-Match (and If-Modified-Since, where last_modified
+alone is enough) with a 304 before the view queries anything else or
+renders a template.
+'''
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request, session
+from sqlalchemy import event, inspect
+
+from clock import now
+from dates import current_locale
+from models import Artist, Venue, Show, VenueAreaSummary, db
+
+
+def _touch(connection, table, ids):
+    ids = {id for id in ids if id is not None}
+    if ids:
+        connection.execute(
+            db.update(table).where(table.c.id.in_(ids)).values(
+                updated_at=datetime.utcnow())
+        )
+
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_update')
+@event.listens_for(Show, 'after_delete')
+def _propagate_show_write(mapper, connection, show):
+    '''A show write changes both its venue's page and its artist's page.'''
+    state = inspect(show)
+    for table, attr in ((Venue.__table__, 'venue_id'), (Artist.__table__, 'artist_id')):
+        history = state.attrs[attr].history
+        _touch(connection, table, [getattr(show, attr)] + list(history.deleted or ()))
+
+
+# Columns of a venue or artist that pages on the other side of its shows
+# display next to each booking.
+_listed_columns = ('name', 'image_link')
+
+_counterparts = {
+    Venue: (Artist.__table__, Show.venue_id, Show.artist_id),
+    Artist: (Venue.__table__, Show.artist_id, Show.venue_id),
+}
+
+
+@event.listens_for(Venue, 'after_update')
+@event.listens_for(Artist, 'after_update')
+def _propagate_listed_change(mapper, connection, entity):
+    '''Renaming a venue or artist, or changing its image, changes the page
+    of everything it has shows with.'''
+    state = inspect(entity)
+    if not any(state.attrs[name].history.has_changes() for name in _listed_columns):
+        return
+    table, fk, counterpart_fk = _counterparts[type(entity)]
+    connection.execute(
+        db.update(table).where(
+            table.c.id.in_(db.select(counterpart_fk).where(fk == entity.id))
+        ).values(updated_at=datetime.utcnow())
+    )
+
+
+_entity_sides = {
+    'venue': (Venue, Show.venue_id),
+    'artist': (Artist, Show.artist_id),
+}
+
+
+def entity_validator(side, entity_id):
+    '''Validator for a venue or artist page, or None if it does not exist.
+
+    Show writes and counterpart edits all touch the entity's updated_at, so
+    that and the upcoming count (an index range on fk, start_time) cover
+    the whole page without reading the entity's show history.
+    '''
+    model, fk = _entity_sides[side]
+    upcoming = db.session.query(db.func.count(Show.id)).filter(
+        fk == entity_id, Show.start_time >= now()
+    ).scalar_subquery()
+    row = db.session.query(model.updated_at, upcoming).filter(model.id == entity_id).first()
+    if row is None:
+        return None
+    return _newest(row[:1]), (side, entity_id, row[1])
+
+
+def venues_validator():
+    row = db.session.query(
+        db.session.query(db.func.max(Venue.updated_at)).scalar_subquery(),
+        db.session.query(db.func.count(VenueAreaSummary.venue_id)).scalar_subquery(),
+        db.session.query(db.func.sum(Venue.upcoming_shows_count)).scalar_subquery(),
+    ).one()
+    return _newest(row[:1]), ('venues',) + tuple(row[1:])
+
+
+def artists_validator():
+    row = db.session.query(
+        db.func.max(Artist.updated_at), db.func.count(Artist.id)
+    ).one()
+    return _newest(row[:1]), ('artists', row[1])
+
+
+def shows_validator():
+    row = db.session.query(
+        db.session.query(db.func.max(Show.updated_at)).scalar_subquery(),
+        db.session.query(db.func.max(Venue.updated_at)).scalar_subquery(),
+        db.session.query(db.func.max(Artist.updated_at)).scalar_subquery(),
+        db.session.query(db.func.count(Show.id)).filter(
+            Show.start_time >= now()).scalar_subquery(),
+    ).one()
+    return _newest(row[:3]), ('shows', sorted(request.args.items(multi=True)), row[3])
+
+
+def _newest(timestamps):
+    timestamps = [ts for ts in timestamps if ts is not None]
+    if not timestamps:
+        return None
+    return max(timestamps).replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def conditional_get(validator, if_modified_since=False):
+    '''Answer conditional GETs for a view from `validator(**view_args)`.
+
+    The validator returns (last_modified, parts) or None when it cannot
+    vouch for the page (e.g. the entity does not exist), in which case the
+    view runs as usual. Requests carrying pending flash messages always get
+    a full page so the messages are shown.
+
+    If-None-Match is checked against an ETag over every part. A bare
+    If-Modified-Since only sees last_modified, which misses pages that
+    change as time passes (shows moving from upcoming to past), so it is
+    honoured only for validators whose parts never change without a write:
+    pass `if_modified_since=True` for those.
+    '''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if session.get('_flashes'):
+                return view(**kwargs)
+            result = validator(**kwargs)
+            if result is None:
+                return view(**kwargs)
+            last_modified, parts = result
+            etag = hashlib.sha1(
+                repr(parts + (last_modified, current_locale())).encode('utf-8')
+            ).hexdigest()
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                not_modified = (
+                    if_modified_since
+                    and last_modified is not None
+                    and request.if_modified_since is not None
+                    and last_modified <= request.if_modified_since
+                )
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**kwargs))
+                # Error pages, and pages whose view flashed a message, must not
+                # become the copy a browser revalidates into 304s.
+                if response.status_code != 200 or session.modified:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.vary.add('Accept-Language')
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
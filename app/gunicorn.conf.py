@@ -0,0 +1,46 @@
+'''gunicorn settings; picked up automatically when gunicorn runs from this directory.
+
+Every setting can be overridden from the environment:
+
+    WEB_CONCURRENCY   worker processes (default 2 * cores + 1)
+    GUNICORN_THREADS  threads per worker (default 4)
+    GUNICORN_TIMEOUT  seconds before a silent worker is restarted (default 30)
+    PORT              port to bind on all interfaces (default 8000)
+
+Keep WEB_CONCURRENCY * GUNICORN_THREADS per host within the database pool
+(DB_POOL_SIZE + DB_MAX_OVERFLOW per worker) and max_connections.
+'''
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', 8000))
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import and warm the app once in the master; workers fork from it.
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot accumulate.
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    '''Give each worker its own connection pool.
+
+    The master already disposed of its pool after warming up. This also
+    covers connections opened between the warm-up and the fork. close=False
+    leaves those sockets to the parent instead of closing them under it.
+    '''
+    from models import db
+    from wsgi import app
+    db.dispose_engines(app, close=False)
@@ -0,0 +1,428 @@
+'''Bulk import of venues, artists and shows from CSV or JSON lines.
+
+    flask import venues venues.csv
+    flask import shows shows.jsonl --rejects shows.rejects.csv --jobs 4
+
+Every row is validated with the form used by the HTML submission
+(VenueForm, ArtistForm or ShowForm, without CSRF). Valid rows are COPYed
+into a temporary staging table one batch at a time. They are then merged
+into the real table with set-based SQL in a single transaction. Rows that
+fail validation, and shows whose venue or artist does not exist, are
+written to the rejects file with the reason.
+
+Venue and artist rows may carry an `id`: the record with that id is
+updated, or created under that id. Rows without one become new records.
+Genres are a list in JSON lines and a comma-separated cell in CSV.
+
+The merge bypasses the ORM events that maintain the venue area summary,
+the upcoming show counters and updated_at, so the import brings those up
+to date itself before it returns.
+'''
+import csv
+import io
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing import get_context
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from werkzeug.datastructures import MultiDict
+
+from clock import now
+from counters import repair_drift
+from models import Artist, Venue, Show, db
+from summary import rebuild
+
+BATCH_SIZE = 10000
+
+
+class ImportSpec(object):
+    '''How rows of one kind map from the file, through a form, to a table.'''
+
+    def __init__(self, model, form_name, fields, id_fields):
+        self.model = model
+        self.form_name = form_name
+        # (table column, form field) pairs
+        self.fields = fields
+        # integer columns validated outside the form
+        self.id_fields = id_fields
+
+    def form(self, **kwargs):
+        import forms
+        return getattr(forms, self.form_name)(**kwargs)
+
+    @property
+    def table(self):
+        return self.model.__tablename__
+
+    @property
+    def columns(self):
+        return [column for column, _ in self.fields]
+
+
+_entity_fields = [
+    ('name', 'name'), ('city', 'city'), ('state', 'state'), ('phone', 'phone'),
+    ('image_link', 'image_link'), ('genres', 'genres'),
+    ('facebook_link', 'facebook_link'), ('website', 'website_link'),
+    ('seeking_description', 'seeking_description'),
+]
+
+specs = {
+    'venues': ImportSpec(
+        Venue, 'VenueForm',
+        [('id', None), ('address', 'address'), ('seeking_talent', 'seeking_talent')] + _entity_fields,
+        id_fields=('id',),
+    ),
+    'artists': ImportSpec(
+        Artist, 'ArtistForm',
+        [('id', None), ('seeking_venue', 'seeking_venue')] + _entity_fields,
+        id_fields=('id',),
+    ),
+    'shows': ImportSpec(
+        Show, 'ShowForm',
+        [('artist_id', 'artist_id'), ('venue_id', 'venue_id'), ('start_time', 'start_time')],
+        id_fields=('artist_id', 'venue_id'),
+    ),
+}
+
+
+#  Reading and validation
+#  ----------------------------------------------------------------
+
+def read_rows(path, format):
+    '''Yield (line number, row dict) pairs; row is None if the line is not valid JSON.'''
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_datetime(value):
+    '''Parse ISO 8601 as written by `flask export-shows`, or return None.
+
+    Microseconds, a `T` separator and a UTC offset are all accepted; aware
+    values are converted to local time like the rest of the app's dates.
+    '''
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _formdata(form, row):
+    '''Turn a file row into form data the way a browser would submit it.'''
+    from wtforms import DateTimeField, SelectMultipleField
+    pairs = []
+    for name, field in form._fields.items():
+        value = row.get(name)
+        if value is None:
+            value = ''
+        if isinstance(field, SelectMultipleField):
+            values = value.split(',') if isinstance(value, str) else value
+            values = [str(v).strip() for v in values if str(v).strip()]
+            pairs.extend((name, v) for v in values)
+            continue
+        if isinstance(value, bool):
+            value = 'y' if value else ''
+        elif isinstance(field, DateTimeField) and isinstance(value, str):
+            parsed = _parse_datetime(value)
+            if parsed is not None:
+                value = parsed.strftime(field.format[0])
+        pairs.append((name, str(value)))
+    return MultiDict(pairs)
+
+
+def _copy_value(value):
+    '''Encode one value for COPY ... FROM STDIN in text format.'''
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        value = '{' + ','.join(
+            '"' + v.replace('\\', '\\\\').replace('"', '\\"') + '"' for v in value
+        ) + '}'
+    elif isinstance(value, datetime):
+        value = value.isoformat(sep=' ')
+    else:
+        value = str(value)
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+_forms = {}
+# The app validation workers run under; set before they are forked.
+_app = None
+
+
+def _validate_batch(kind, batch):
+    spec = specs[kind]
+    form = _forms.get(kind)
+    if form is None:
+        form = _forms[kind] = spec.form(formdata=None, meta={'csrf': False})
+
+    lines = []
+    rejects = []
+    for line, row in batch:
+        if row is None:
+            rejects.append((line, 'not a JSON object', None))
+            continue
+        # fall back to table column names, e.g. `website` for `website_link`
+        row = dict(row)
+        for column, field in spec.fields:
+            if field and field not in row and column in row:
+                row[field] = row[column]
+
+        errors = []
+        ids = {}
+        for column in spec.id_fields:
+            value = row.get(column)
+            if value in (None, ''):
+                ids[column] = None
+                continue
+            try:
+                ids[column] = int(value)
+            except (TypeError, ValueError):
+                errors.append('{}: must be an integer'.format(column))
+
+        form.process(_formdata(form, row))
+        if not form.validate():
+            errors.extend(
+                '{}: {}'.format(name, message)
+                for name, messages in form.errors.items() for message in messages
+            )
+        if kind == 'shows':
+            errors.extend(
+                '{}: This field is required.'.format(column)
+                for column, value in ids.items() if value is None
+            )
+        if errors:
+            rejects.append((line, '; '.join(errors), row))
+            continue
+
+        values = [line]
+        for column, field in spec.fields:
+            value = ids[column] if column in ids else form[field].data
+            if isinstance(value, datetime):
+                # the form's format drops microseconds; keep the file's value
+                value = _parse_datetime(row[field]) if isinstance(row.get(field), str) else value
+            values.append(value)
+        lines.append('\t'.join(_copy_value(v) for v in values))
+
+    return ''.join(line + '\n' for line in lines), len(lines), rejects
+
+
+def validate_batch(kind, batch):
+    '''Validate [(line, row)] and return (COPY text, accepted count, rejects).'''
+    if has_app_context():
+        return _validate_batch(kind, batch)
+    with _app.app_context():
+        return _validate_batch(kind, batch)
+
+
+def validated(kind, batches, jobs):
+    '''Validate batches in order, fanning out to `jobs` worker processes.
+
+    At most 2 * jobs batches are in flight, so memory stays bounded however
+    large the input file is.
+    '''
+    global _app
+    _app = current_app._get_current_object()
+    if jobs <= 1:
+        for batch in batches:
+            yield validate_batch(kind, batch)
+        return
+    with get_context('fork').Pool(jobs) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.apply_async(validate_batch, (kind, batch)))
+            if len(pending) > 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+#  Staging and merge
+#  ----------------------------------------------------------------
+
+def _staging(spec):
+    return 'import_' + spec.table
+
+
+def create_staging(spec):
+    db.session.execute(db.text(
+        'CREATE TEMP TABLE {} ON COMMIT DROP AS '
+        'SELECT NULL::integer AS line, {} FROM {} WITH NO DATA'.format(
+            _staging(spec), ', '.join(spec.columns), spec.table)))
+
+
+def copy_into_staging(spec, text):
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY {} (line, {}) FROM STDIN'.format(_staging(spec), ', '.join(spec.columns)),
+            io.StringIO(text))
+    finally:
+        cursor.close()
+
+
+_counterpart_tables = {
+    'venues': ('artists', 'venue_id', 'artist_id'),
+    'artists': ('venues', 'artist_id', 'venue_id'),
+}
+
+
+def _merge_entities(spec):
+    staging = _staging(spec)
+    data_columns = ', '.join(c for c in spec.columns if c != 'id')
+    updates = ', '.join('{0} = excluded.{0}'.format(c) for c in spec.columns if c != 'id')
+    merged = db.session.execute(db.text(
+        'INSERT INTO {table} (id, {cols}) '
+        'SELECT DISTINCT ON (id) id, {cols} FROM {staging} '
+        'WHERE id IS NOT NULL ORDER BY id, line DESC '
+        "ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = timezone('utc', now())".format(
+            table=spec.table, cols=data_columns, staging=staging, updates=updates)
+    )).rowcount
+    if merged:
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+            "(SELECT max(id) FROM {0}))".format(spec.table)))
+    if merged:
+        # updated records may be renamed on the pages of their counterparts
+        counterpart, fk, counterpart_fk = _counterpart_tables[spec.table]
+        db.session.execute(db.text(
+            "UPDATE {0} SET updated_at = timezone('utc', now()) WHERE id IN "
+            '(SELECT {1} FROM shows WHERE {2} IN (SELECT id FROM {3}))'.format(
+                counterpart, counterpart_fk, fk, staging)))
+    inserted = db.session.execute(db.text(
+        'INSERT INTO {table} ({cols}) SELECT {cols} FROM {staging} '
+        'WHERE id IS NULL ORDER BY line'.format(
+            table=spec.table, cols=data_columns, staging=staging)
+    )).rowcount
+    return merged + inserted, []
+
+
+def _merge_shows(spec):
+    staging = _staging(spec)
+    orphans = db.session.execute(db.text(
+        'SELECT s.line, s.artist_id, s.venue_id, s.start_time, a.id IS NULL, v.id IS NULL '
+        'FROM {} s '
+        'LEFT JOIN artists a ON a.id = s.artist_id '
+        'LEFT JOIN venues v ON v.id = s.venue_id '
+        'WHERE a.id IS NULL OR v.id IS NULL ORDER BY s.line'.format(staging)
+    ))
+    rejects = [
+        (line, '; '.join(reason for reason, missing in (
+            ('artist_id: no such artist', no_artist),
+            ('venue_id: no such venue', no_venue)) if missing),
+         {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time.isoformat()})
+        for line, artist_id, venue_id, start_time, no_artist, no_venue in orphans
+    ]
+    inserted = db.session.execute(db.text(
+        'INSERT INTO shows (artist_id, venue_id, start_time) '
+        'SELECT s.artist_id, s.venue_id, s.start_time FROM {} s '
+        'JOIN artists a ON a.id = s.artist_id '
+        'JOIN venues v ON v.id = s.venue_id ORDER BY s.line'.format(staging)
+    )).rowcount
+    for table, fk in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        db.session.execute(db.text(
+            "UPDATE {0} SET updated_at = timezone('utc', now()) "
+            'WHERE id IN (SELECT {1} FROM {2})'.format(table, fk, staging)))
+    return inserted, rejects
+
+
+def merge(kind):
+    '''Move staged rows into the real table; return (rows written, rejects).'''
+    spec = specs[kind]
+    if kind == 'shows':
+        return _merge_shows(spec)
+    return _merge_entities(spec)
+
+
+def write_rejects(path, rejects):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('line', 'reason', 'row'))
+        for line, reason, row in sorted(rejects, key=lambda reject: reject[0]):
+            writer.writerow((line, reason, json.dumps(row, default=str) if row is not None else ''))
+
+
+def import_file(kind, path, format, batch_size=BATCH_SIZE, jobs=1):
+    '''Validate, stage and merge one file in a single transaction.
+
+    Returns (rows written, rejects).
+    '''
+    spec = specs[kind]
+    rejects = []
+    try:
+        create_staging(spec)
+        batches = _batched(read_rows(path, format), batch_size)
+        for text, accepted, batch_rejects in validated(kind, batches, jobs):
+            rejects.extend(batch_rejects)
+            if accepted:
+                copy_into_staging(spec, text)
+        written, merge_rejects = merge(kind)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    rebuild()
+    repair_drift(now())
+    return written, rejects + merge_rejects
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(specs)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; defaults to the file extension.')
+@click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False, writable=True),
+              help='Where to write rejected rows; defaults to PATH.rejects.csv.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True,
+              help='Rows validated and COPYed per batch.')
+@click.option('--jobs', default=1, show_default=True,
+              help='Worker processes validating rows in parallel.')
+@with_appcontext
+def import_command(kind, path, format, rejects_path, batch_size, jobs):
+    '''Load venues, artists or shows from a CSV or JSON lines file.'''
+    format = format or ('jsonl' if os.path.splitext(path)[1] in ('.jsonl', '.ndjson') else 'csv')
+    started = time.monotonic()
+    written, rejects = import_file(kind, path, format, batch_size, jobs)
+    elapsed = time.monotonic() - started
+
+    if rejects:
+        rejects_path = rejects_path or path + '.rejects.csv'
+        write_rejects(rejects_path, rejects)
+    total = written + len(rejects)
+    click.echo('{}: {} imported, {} rejected{} in {:.1f}s ({:.0f} rows/s)'.format(
+        kind, written, len(rejects),
+        ' (see {})'.format(rejects_path) if rejects else '',
+        elapsed, total / elapsed if elapsed else total))
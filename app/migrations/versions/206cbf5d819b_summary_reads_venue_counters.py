@@ -0,0 +1,28 @@
+"""summary reads venue counters
+
+Revision ID: 206cbf5d819b
+Revises: 2d5c0357f19d
+Create Date: 2026-10-18 19:44:28.396491
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '206cbf5d819b'
+down_revision = '2d5c0357f19d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_column('venue_area_summary', 'upcoming_shows_count')
+
+
+def downgrade():
+    op.add_column('venue_area_summary', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE venue_area_summary SET upcoming_shows_count = venues.upcoming_shows_count '
+        'FROM venues WHERE venues.id = venue_area_summary.venue_id'
+    )
@@ -0,0 +1,38 @@
+"""updated_at columns
+
+Revision ID: 2d5c0357f19d
+Revises: b579fb1f4e19
+Create Date: 2026-10-18 21:12:40.207816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d5c0357f19d'
+down_revision = 'b579fb1f4e19'
+branch_labels = None
+depends_on = None
+
+
+tables = ('venues', 'artists', 'shows')
+
+
+def upgrade():
+    for table in tables:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False))
+    # max(updated_at) backs the conditional GET validators. As in a5e52636c132,
+    # the indexes build CONCURRENTLY, outside the transaction, so the tables
+    # stay writable meanwhile.
+    with op.get_context().autocommit_block():
+        for table in tables:
+            op.create_index(op.f('ix_{}_updated_at'.format(table)), table, ['updated_at'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in reversed(tables):
+            op.drop_index(op.f('ix_{}_updated_at'.format(table)), table_name=table, postgresql_concurrently=True)
+    for table in reversed(tables):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,42 @@
+"""venue area summary
+
+Revision ID: 4d838c32abaf
+Revises: 1a82a6ab4c74
+Create Date: 2026-10-18 19:02:11.118520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d838c32abaf'
+down_revision = '1a82a6ab4c74'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('venue_area_summary',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('venue_name', sa.String(length=120), nullable=False),
+    sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id')
+    )
+    op.create_index('ix_venue_area_summary_area', 'venue_area_summary', ['state', 'city', 'venue_name'], unique=False)
+    op.execute(
+        'INSERT INTO venue_area_summary '
+        '(venue_id, city, state, venue_name, upcoming_shows_count) '
+        'SELECT venues.id, venues.city, venues.state, venues.name, count(shows.id) '
+        'FROM venues LEFT OUTER JOIN shows '
+        'ON shows.venue_id = venues.id AND shows.start_time > now() '
+        'GROUP BY venues.id'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_venue_area_summary_area', table_name='venue_area_summary')
+    op.drop_table('venue_area_summary')
@@ -0,0 +1,40 @@
+"""listing and show indexes
+
+Revision ID: a5e52636c132
+Revises: 47bd3f9e1ab3
+Create Date: 2026-10-18 20:03:58.771430
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5e52636c132'
+down_revision = '47bd3f9e1ab3'
+branch_labels = None
+depends_on = None
+
+# CREATE INDEX CONCURRENTLY cannot run inside a transaction, so every
+# statement runs in an autocommit block and the tables stay writable while
+# the indexes build.
+indexes = [
+    ('ix_venues_city_state', 'venues', ['city', 'state']),
+    ('ix_venues_lower_name', 'venues', [sa.text('lower(name)')]),
+    ('ix_artists_lower_name', 'artists', [sa.text('lower(name)')]),
+    ('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time']),
+    ('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time']),
+    ('ix_shows_start_time', 'shows', ['start_time']),
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(indexes):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
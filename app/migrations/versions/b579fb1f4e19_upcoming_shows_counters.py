@@ -0,0 +1,33 @@
+"""upcoming shows counters
+
+Revision ID: b579fb1f4e19
+Revises: a5e52636c132
+Create Date: 2026-10-18 20:31:05.913371
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b579fb1f4e19'
+down_revision = 'a5e52636c132'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('artists', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    for table, fk in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(
+            'UPDATE {0} SET upcoming_shows_count = counts.n '
+            'FROM (SELECT {1} AS id, count(*) AS n FROM shows '
+            'WHERE start_time >= now() GROUP BY {1}) AS counts '
+            'WHERE {0}.id = counts.id'.format(table, fk)
+        )
+
+
+def downgrade():
+    op.drop_column('artists', 'upcoming_shows_count')
+    op.drop_column('venues', 'upcoming_shows_count')
@@ -1,16 +1,17 @@
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-from flask import Flask
-from flask_migrate import Migrate
+from datetime import datetime
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+from routing import RoutingSQLAlchemy
+
+# Bound to an app by create_app (see factory.py).
+db = RoutingSQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venues_city_state', 'city', 'state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -24,6 +25,12 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500), default='')
     genres = db.Column(db.ARRAY(db.String))
+    upcoming_shows_count = db.Column(
+        db.Integer, default=0, server_default='0', nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+        server_default=db.text("timezone('utc', now())"), nullable=False,
+        index=True)
 
     artists = db.relationship('Artist', secondary='shows')
     shows = db.relationship('Show', backref='venues')
@@ -34,6 +41,10 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
@@ -46,6 +57,12 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500), default='')
     website = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(
+        db.Integer, default=0, server_default='0', nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+        server_default=db.text("timezone('utc', now())"), nullable=False,
+        index=True)
 
     venues = db.relationship('Venue', secondary='shows')
     shows = db.relationship('Show', backref='artists')
@@ -55,12 +72,42 @@ class Artist(db.Model):
 
 class Show(db.Model):
   __tablename__ = 'shows'
+  __table_args__ = (
+    db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+    db.Index('ix_shows_start_time', 'start_time'),
+  )
+
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey(
         'artists.id', ondelete='CASCADE'),  nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey(
         'venues.id', ondelete='CASCADE'), nullable=False)
   start_time = db.Column(db.DateTime(), nullable=False)
+  updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+        server_default=db.text("timezone('utc', now())"), nullable=False,
+        index=True)
 
   venue = db.relationship('Venue')
-  artist = db.relationship('Artist')
\ No newline at end of file
+  artist = db.relationship('Artist')
+
+
+db.Index('ix_venues_lower_name', db.func.lower(Venue.name))
+db.Index('ix_artists_lower_name', db.func.lower(Artist.name))
+
+
+class VenueAreaSummary(db.Model):
+    __tablename__ = 'venue_area_summary'
+    __table_args__ = (
+        db.Index('ix_venue_area_summary_area', 'state', 'city', 'venue_name'),
+    )
+
+    venue_id = db.Column(db.Integer, db.ForeignKey(
+        'venues.id', ondelete='CASCADE'), primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    venue_name = db.Column(db.String(120), nullable=False)
+
+    def __repr__(self):
+      return '<VenueAreaSummary {}, {}>'.format(self.venue_id, self.venue_name)
@@ -0,0 +1,148 @@
+'''Full-page cache with stale-while-revalidate for anonymous GET traffic.
+
+Views decorated with `page_cache.cached(ttl, stale_ttl)` are stored whole
+(body, status and headers) under a normalised key: the path, the query
+arguments minus tracking parameters and empty values, and the negotiated
+locale. For `ttl` seconds a hit is served straight from memory. For the
+following `stale_ttl` seconds the stale copy is still served while one
+background thread per key re-renders the page. Past that the request
+renders synchronously.
+
+Only anonymous requests are cached: anything carrying the session cookie
+(pending flash messages, form state) or an Authorization header goes
+straight to the view, and a response whose view flashed a message is
+served but not stored. POST handlers call `invalidate(path)` after they
+commit; that bumps the path's generation and orphans its entries in this
+worker, while other workers pick the change up within `ttl`.
+'''
+import threading
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, current_app, make_response, request, session
+
+from cache import LRUCache
+from dates import current_locale
+from routing import read_from_primary
+
+TRACKING_PARAMS = ('fbclid', 'gclid', 'mc_cid', 'mc_eid')
+
+
+class PageStore(object):
+    '''One app's cached pages, path generations and in-flight refreshes.'''
+
+    def __init__(self, maxsize):
+        self.pages = LRUCache(maxsize)
+        self.generations = {}
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+
+class PageCache(object):
+    '''Page cache extension; each app's state lives in app.extensions.'''
+
+    def init_app(self, app):
+        app.extensions['page_cache'] = PageStore(app.config['PAGE_CACHE_SIZE'])
+
+    @property
+    def state(self):
+        return current_app.extensions['page_cache']
+
+    def invalidate(self, *paths):
+        state = self.state
+        with state.lock:
+            for path in paths:
+                state.generations[path] = state.generations.get(path, 0) + 1
+
+    def key(self):
+        args = sorted(
+            (name, value) for name, value in request.args.items(multi=True)
+            if value and not name.startswith('utm_') and name not in TRACKING_PARAMS
+        )
+        return '{}|{}|{}|{}'.format(
+            request.path, self.state.generations.get(request.path, 0),
+            urlencode(args), current_locale())
+
+    def cacheable_request(self):
+        return (
+            current_app.config['PAGE_CACHE_ENABLED']
+            and request.method == 'GET'
+            and 'Authorization' not in request.headers
+            and current_app.session_cookie_name not in request.cookies
+        )
+
+    def cached(self, ttl, stale_ttl=0):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if not self.cacheable_request():
+                    return view(**kwargs)
+                key = self.key()
+                entry = self.state.pages.get(key)
+                if entry is not None:
+                    age = time.monotonic() - entry[0]
+                    if age < ttl:
+                        return self._respond(entry, age, 'hit')
+                    if age < ttl + stale_ttl:
+                        self._refresh_in_background(key, view, kwargs, ttl + stale_ttl)
+                        return self._respond(entry, age, 'stale')
+
+                read_from_primary()
+                response = make_response(view(**kwargs))
+                self._store(key, response, ttl + stale_ttl)
+                response.headers['X-Page-Cache'] = 'miss'
+                return response
+            return wrapper
+        return decorator
+
+    def _store(self, key, response, lifetime):
+        # 304s answer one client's validators and cookies belong to one
+        # visitor, so neither may be shared. The session cookie is only
+        # written after this runs, so a view that flashed a message (or
+        # rendered one, popping it) shows up as a modified session instead.
+        if (response.status_code != 200 or 'Set-Cookie' in response.headers
+                or session.modified or '_flashes' in session):
+            return
+        entry = (
+            time.monotonic(),
+            response.get_data(),
+            response.status_code,
+            [(name, value) for name, value in response.headers
+             if name not in ('Content-Length', 'X-Page-Cache')],
+        )
+        self.state.pages.set(key, entry, ttl=lifetime)
+
+    def _respond(self, entry, age, state):
+        created_at, body, status, headers = entry
+        response = Response(body, status=status, headers=headers)
+        response.headers['Age'] = str(int(age))
+        response.headers['X-Page-Cache'] = state
+        return response.make_conditional(request)
+
+    def _refresh_in_background(self, key, view, kwargs, lifetime):
+        state = self.state
+        with state.lock:
+            if key in state.refreshing:
+                return
+            state.refreshing.add(key)
+
+        app = current_app._get_current_object()
+        path = request.full_path
+        headers = {'Accept-Language': request.headers.get('Accept-Language', '')}
+
+        def refresh():
+            try:
+                with app.test_request_context(path, headers=headers):
+                    read_from_primary()
+                    self._store(key, make_response(view(**kwargs)), lifetime)
+            except Exception:
+                app.logger.exception('page cache refresh failed for %s', path)
+            finally:
+                with state.lock:
+                    state.refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+page_cache = PageCache()
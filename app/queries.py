@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy.orm import contains_eager
+
+from models import Artist, Venue, Show, db
+from serializers import serialize_show
+
+
+def group_areas(rows):
+    '''Fold (city, state, venue_id, venue_name, count) rows ordered by area
+    into the nested structure the venues template expects.'''
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [
+                {'id': id, 'name': name, 'num_upcoming_shows': count}
+                for _, _, id, name, count in venues
+            ]
+        })
+    return areas
+
+
+# For each kind of detail page: the shows column holding the page's entity
+# id and the relationship to the entity on the other side of the booking.
+_show_sides = {
+    'venue': (Show.venue_id, 'artist'),
+    'artist': (Show.artist_id, 'venue'),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(show):
+    return '{},{}'.format(show.start_time.isoformat(), show.id)
+
+
+def decode_cursor(cursor):
+    try:
+        start_time, id = cursor.rsplit(',', 1)
+        return datetime.fromisoformat(start_time), int(id)
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+def show_counts(side, entity_id, now):
+    '''Count an entity's past and upcoming shows in one aggregate query.'''
+    fk, _ = _show_sides[side]
+    return db.session.query(
+        db.func.count(Show.id).filter(Show.start_time < now),
+        db.func.count(Show.id).filter(Show.start_time >= now),
+    ).filter(fk == entity_id).one()
+
+
+def show_page(side, entity_id, kind, now, limit, after=None):
+    '''Return one keyset-paginated page of an entity's past or upcoming shows.
+
+    Past shows run newest first and upcoming shows soonest first; both are
+    ordered on (start_time, id) so the cursor is stable. Returns the
+    serialised shows and the cursor for the next page, or None.
+    '''
+    fk, counterpart = _show_sides[side]
+    relationship = getattr(Show, counterpart)
+    query = db.session.query(Show).join(relationship).options(
+        contains_eager(relationship)
+    ).filter(fk == entity_id)
+
+    key = db.tuple_(Show.start_time, Show.id)
+    if kind == 'past':
+        query = query.filter(Show.start_time < now).order_by(
+            Show.start_time.desc(), Show.id.desc())
+        if after is not None:
+            query = query.filter(key < decode_cursor(after))
+    else:
+        query = query.filter(Show.start_time >= now).order_by(
+            Show.start_time, Show.id)
+        if after is not None:
+            query = query.filter(key > decode_cursor(after))
+
+    shows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(shows[limit - 1]) if len(shows) > limit else None
+    return [serialize_show(show, counterpart) for show in shows[:limit]], next_cursor
+
+
+def show_history(side, entity_id, now, limit):
+    '''Build the past/upcoming blocks of a venue or artist detail page.
+
+    Only the first page of each block is loaded; the counts come from an
+    aggregate, so the cost does not grow with the entity's history.
+    '''
+    past_shows_count, upcoming_shows_count = show_counts(side, entity_id, now)
+    past_shows, past_shows_next = show_page(side, entity_id, 'past', now, limit)
+    upcoming_shows, upcoming_shows_next = show_page(
+        side, entity_id, 'upcoming', now, limit)
+    return {
+        'past_shows': past_shows,
+        'upcoming_shows': upcoming_shows,
+        'past_shows_count': past_shows_count,
+        'upcoming_shows_count': upcoming_shows_count,
+        'past_shows_next': past_shows_next,
+        'upcoming_shows_next': upcoming_shows_next,
+    }
+
+
+def parse_date_bound(value, end=False):
+    '''Parse a `from`/`to` query argument; a bare date used as an upper
+    bound covers the whole of that day.'''
+    bound = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        bound += timedelta(days=1)
+    return bound
+
+
+def show_listing(start, end, limit, after=None):
+    '''Return one page of shows starting in [start, end) with venue and
+    artist names joined in, plus the cursor for the next page or None.'''
+    query = db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+    ).join(
+        Venue, Show.venue_id == Venue.id
+    ).join(
+        Artist, Show.artist_id == Artist.id
+    ).filter(
+        Show.start_time >= start
+    ).order_by(
+        Show.start_time, Show.id
+    )
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    if after is not None:
+        query = query.filter(
+            db.tuple_(Show.start_time, Show.id) > decode_cursor(after))
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    data = [
+        {
+            'venue_id': row.venue_id,
+            'venue_name': row.venue_name,
+            'artist_id': row.artist_id,
+            'artist_name': row.artist_name,
+            'artist_image_link': row.artist_image_link,
+            'start_time': row.start_time,
+        }
+        for row in rows[:limit]
+    ]
+    return data, next_cursor
@@ -0,0 +1,136 @@
+'''Per-request SQL query counting and N+1 detection.
+
+Every statement a request sends to any engine (primary or replica) is
+counted, timed and grouped by shape: the SQL text with IN lists collapsed,
+so the same query for different ids is one shape. When the view returns,
+the totals go out as X-Query-Count, X-Query-Time (ms) and X-Query-Repeats
+(the most executions of a single shape) plus a Server-Timing entry, and
+into the debug log.
+
+A request that runs more than QUERY_BUDGET statements, or one shape more
+than QUERY_REPEAT_LIMIT times (the mark of a lazy load inside a loop), is
+logged as a warning. With QUERY_BUDGET_RAISE set, as in the testing
+profile, it raises QueryBudgetExceeded instead, so the test that hit the
+route fails. Views that legitimately need more declare it with
+`@query_budget(...)`.
+
+Statements issued while a streamed response body is generated, after the
+view has returned, are not counted.
+'''
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_IN_LIST = re.compile(r'\((?:\s*(?:%\(\w+\)s|\?)\s*,)+\s*(?:%\(\w+\)s|\?)\s*\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def statement_shape(statement):
+    return _IN_LIST.sub('(...)', statement)
+
+
+class RequestQueries(object):
+    '''Statements run during one request.'''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def most_repeated(self):
+        '''Return (shape, executions) of the most repeated statement.'''
+        if not self.shapes:
+            return None, 0
+        return self.shapes.most_common(1)[0]
+
+
+def _current():
+    return g.get('_queries') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _current()
+    started = conn.info.get('_query_started')
+    if queries is not None and started:
+        queries.record(statement, time.perf_counter() - started.pop())
+
+
+def query_budget(queries=None, repeats=None):
+    '''Override QUERY_BUDGET and/or QUERY_REPEAT_LIMIT for one view.'''
+    def decorator(view):
+        view.query_budget = (queries, repeats)
+        return view
+    return decorator
+
+
+class QueryCounter(object):
+    '''Stateless: the engine listeners are process-wide and only record
+    while a request of an app with QUERY_STATS_ENABLED is in progress.'''
+
+    def init_app(self, app):
+        if not app.config['QUERY_STATS_ENABLED']:
+            return
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._start)
+        app.after_request(self._report)
+
+    def _start(self):
+        g._queries = RequestQueries()
+
+    def _report(self, response):
+        queries = g.pop('_queries', None)
+        if queries is None:
+            return response
+        shape, repeats = queries.most_repeated()
+        milliseconds = queries.seconds * 1000
+        response.headers['X-Query-Count'] = str(queries.count)
+        response.headers['X-Query-Time'] = '{:.1f}'.format(milliseconds)
+        response.headers['X-Query-Repeats'] = str(repeats)
+        response.headers.add(
+            'Server-Timing', 'db;dur={:.1f};desc="{} queries"'.format(milliseconds, queries.count))
+
+        config = current_app.config
+        view = current_app.view_functions.get(request.endpoint)
+        budget, repeat_limit = getattr(view, 'query_budget', (None, None))
+        budget = budget if budget is not None else config['QUERY_BUDGET']
+        repeat_limit = repeat_limit if repeat_limit is not None else config['QUERY_REPEAT_LIMIT']
+
+        problems = []
+        if queries.count > budget:
+            problems.append('{} queries, budget is {}'.format(queries.count, budget))
+        if repeats > repeat_limit:
+            problems.append('one statement ran {} times, limit is {}: {}'.format(
+                repeats, repeat_limit, ' '.join(shape.split())))
+        if not problems:
+            current_app.logger.debug(
+                '%s %s: %d queries in %.1f ms, max %d repeats',
+                request.method, request.path, queries.count, milliseconds, repeats)
+            return response
+
+        message = '{} {}: {}'.format(request.method, request.path, '; '.join(problems))
+        if config['QUERY_BUDGET_RAISE']:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+        return response
+
+
+query_counter = QueryCounter()
@@ -0,0 +1,180 @@
+'''Read-replica routing for the SQLAlchemy session.
+
+Views marked with `read_only` read from one of the replicas listed in
+SQLALCHEMY_BINDS under `replica_*` keys (built from DATABASE_REPLICA_URLS
+in config.py), whatever their HTTP method, so the POST search forms are
+served by replicas too. Everything else uses the primary, including
+anything that writes and the rest of a session once it has written.
+
+After a request commits a write, the visitor's session cookie records a
+deadline READ_YOUR_WRITES_SECONDS ahead. Their reads stay on the primary
+until then, so the page that follows a form submission shows the edit even
+if the replicas have not replayed it yet. Renders that fill the shared
+caches call `read_from_primary` so a lagging replica cannot put pre-edit
+data in front of everyone else.
+
+Each replica's lag is checked at most every REPLICA_CHECK_INTERVAL seconds.
+A replica more than REPLICA_MAX_LAG seconds behind, or one that cannot be
+reached, is skipped; with none left, reads fall back to the primary. The
+lag query is PostgreSQL's, and other databases (e.g. SQLite files standing
+in for replicas locally) are assumed current.
+'''
+import random
+import threading
+import time
+
+from flask import current_app, has_request_context, request, session as cookie_session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import event, orm, text
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_PREFIX = 'replica_'
+PIN_KEY = '_primary_until'
+
+_LAG_QUERY = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() '
+    'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class ReplicaHealth(object):
+    '''Remembers for a while whether each replica is fit to serve reads.'''
+
+    def __init__(self):
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def healthy(self, key, engine, max_lag, interval):
+        checked = self._checked.get(key)
+        if checked is not None and time.monotonic() - checked[0] < interval:
+            return checked[1]
+        healthy = self._check(engine, max_lag)
+        with self._lock:
+            self._checked[key] = (time.monotonic(), healthy)
+        return healthy
+
+    def _check(self, engine, max_lag):
+        if engine.dialect.name != 'postgresql':
+            return True
+        try:
+            with engine.connect() as connection:
+                lag = connection.execute(_LAG_QUERY).scalar()
+        except Exception:
+            current_app.logger.warning('replica %r is unreachable', engine.url, exc_info=True)
+            return False
+        # NULL: in recovery but nothing replayed yet
+        return lag is not None and lag <= max_lag
+
+
+health = ReplicaHealth()
+
+
+def replica_keys(app):
+    return sorted(
+        key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+        if key.startswith(REPLICA_PREFIX)
+    )
+
+
+def pinned_to_primary():
+    '''Whether this visitor wrote recently enough to need the primary.'''
+    until = cookie_session.get(PIN_KEY)
+    if until is None:
+        return False
+    if until > time.time():
+        return True
+    cookie_session.pop(PIN_KEY, None)
+    return False
+
+
+def read_only(view):
+    '''Mark a view as safe to serve from a replica.'''
+    view.read_only = True
+    return view
+
+
+def read_from_primary():
+    '''Send the rest of this request's reads to the primary.
+
+    For renders that populate the shared page and fragment caches: read
+    from a lagging replica just after an edit, they would store the old
+    data under the new version for everyone.
+    '''
+    get_state(current_app).db.session()._replica = False
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        # engine serving this session's reads; False once settled on the primary
+        self._replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        if self.info.get('wrote'):
+            return super().get_bind(mapper, clause)
+        if self._replica is None:
+            self._replica = self._choose_replica() or False
+        return self._replica or super().get_bind(mapper, clause)
+
+    def _choose_replica(self):
+        if not has_request_context():
+            return None
+        # checked first so that an expired pin is always cleared
+        if pinned_to_primary():
+            return None
+        view = current_app.view_functions.get(request.endpoint)
+        if not getattr(view, 'read_only', False):
+            return None
+        keys = replica_keys(self.app)
+        if not keys:
+            return None
+        db = get_state(self.app).db
+        config = self.app.config
+        for key in random.sample(keys, len(keys)):
+            engine = db.get_engine(self.app, bind=key)
+            if health.healthy(key, engine, config['REPLICA_MAX_LAG'], config['REPLICA_CHECK_INTERVAL']):
+                return engine
+        return None
+
+
+def _pin_after_write(session):
+    if not session.info.pop('wrote', False):
+        return
+    session._replica = False
+    # without replicas every read is already on the primary, and a pin would
+    # only keep the visitor out of the page cache
+    if has_request_context() and replica_keys(current_app):
+        cookie_session[PIN_KEY] = time.time() + current_app.config['READ_YOUR_WRITES_SECONDS']
+
+
+def _forget_write(session):
+    session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    '''SQLAlchemy extension whose sessions route reads to replicas.'''
+
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        event.listen(factory, 'after_commit', _pin_after_write)
+        event.listen(factory, 'after_rollback', _forget_write)
+        return factory
+
+    def dispose_engines(self, app, close=True):
+        '''Drop the pooled connections of the primary and every replica.'''
+        for bind in [None] + replica_keys(app):
+            self.get_engine(app, bind=bind).dispose(close=close)
+
+    def create_engine(self, sa_url, engine_opts):
+        # SQLALCHEMY_ENGINE_OPTIONS is tuned for the PostgreSQL primary and
+        # applies to every bind; SQLite stand-ins take no pool or server options.
+        if sa_url.get_backend_name() == 'sqlite':
+            engine_opts = {
+                name: value for name, value in engine_opts.items()
+                if name not in ('pool_size', 'max_overflow', 'pool_timeout', 'connect_args')
+            }
+        return super().create_engine(sa_url, engine_opts)
@@ -0,0 +1,35 @@
+'''Ranked name search for venues and artists.
+
+`name ILIKE '%term%'` is answered from the pg_trgm GIN indexes declared on
+the models, results are ranked by trigram similarity and capped with a
+LIMIT. The total match count comes back from the same query and upcoming
+show counts are read from the denormalised counter columns.
+'''
+from models import db
+
+
+def escape_like(term):
+    # Backslash is PostgreSQL's default LIKE escape character.
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search(model, term, limit):
+    '''Search `model` by name and return the templates' `{count, data}` shape.'''
+    rows = db.session.query(
+        model.id,
+        model.name,
+        model.upcoming_shows_count,
+        db.func.count().over(),
+    ).filter(
+        model.name.ilike('%{}%'.format(escape_like(term)))
+    ).order_by(
+        db.func.similarity(model.name, term).desc(), model.name
+    ).limit(limit).all()
+
+    return {
+        'count': rows[0][3] if rows else 0,
+        'data': [
+            {'id': id, 'name': name, 'num_upcoming_shows': num_upcoming_shows}
+            for id, name, num_upcoming_shows, _ in rows
+        ]
+    }
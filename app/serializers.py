@@ -0,0 +1,14 @@
+def serialize_show(show, counterpart):
+    '''Serialise a show from the point of view of a venue or artist page.
+
+    `counterpart` names the other side of the booking ('artist' on a venue
+    page, 'venue' on an artist page); it must already be loaded on `show`.
+    '''
+    entity = getattr(show, counterpart)
+    return {
+        counterpart + '_id': entity.id,
+        counterpart + '_name': entity.name,
+        counterpart + '_image_link': entity.image_link,
+        'start_time': show.start_time,
+    }
+
@@ -0,0 +1,51 @@
+'''Coalesce concurrent identical computations within a worker.
+
+When many threads ask for the same key at once, the first runs the
+function and the rest wait for its result instead of repeating the work.
+A follower that waits longer than `timeout`, or whose leader failed, runs
+the function itself, so a slow or broken leader never turns into an error
+for everyone. Results are shared between threads and must be treated as
+read-only.
+'''
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight(object):
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(timeout) and not call.failed:
+                return call.result
+            return fn()
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,73 @@
+'''Denormalised venue_area_summary maintenance.
+
+The /venues page reads this table, ordered by area, and takes each venue's
+upcoming show count from venues.upcoming_shows_count (see counters.py), so
+the count is stored and rolled over in one place. Venue form submissions
+keep the summary current inside the same transaction; `flask summary
+refresh` rebuilds it from the venues table after bulk changes.
+'''
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects.postgresql import insert
+
+from models import Venue, VenueAreaSummary, db
+from queries import group_areas
+
+summary_cli = AppGroup('summary', help='Maintain the venue area summary.')
+
+
+def record_venue(venue):
+    '''Insert or update the summary row for a new or edited venue.'''
+    db.session.flush()
+    stmt = insert(VenueAreaSummary).values(
+        venue_id=venue.id,
+        city=venue.city,
+        state=venue.state,
+        venue_name=venue.name,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[VenueAreaSummary.venue_id],
+        set_={
+            'city': stmt.excluded.city,
+            'state': stmt.excluded.state,
+            'venue_name': stmt.excluded.venue_name,
+        }
+    )
+    db.session.execute(stmt)
+
+
+def rebuild():
+    '''Recompute the whole summary from the venues table in one transaction.'''
+    db.session.execute(db.delete(VenueAreaSummary))
+    db.session.execute(
+        insert(VenueAreaSummary).from_select(
+            ['city', 'state', 'venue_id', 'venue_name'],
+            db.select(Venue.city, Venue.state, Venue.id, Venue.name)
+        )
+    )
+    db.session.commit()
+
+
+def summary_areas():
+    '''Return the /venues listing straight from the precomputed summary.'''
+    rows = db.session.query(
+        VenueAreaSummary.city,
+        VenueAreaSummary.state,
+        VenueAreaSummary.venue_id,
+        VenueAreaSummary.venue_name,
+        Venue.upcoming_shows_count,
+    ).join(
+        Venue, Venue.id == VenueAreaSummary.venue_id
+    ).order_by(
+        VenueAreaSummary.state,
+        VenueAreaSummary.city,
+        VenueAreaSummary.venue_name,
+    ).all()
+    return group_areas(rows)
+
+
+@summary_cli.command('refresh')
+def refresh_command():
+    '''Rebuild the summary after changes made outside the app.'''
+    rebuild()
+    click.echo('venue_area_summary rebuilt')
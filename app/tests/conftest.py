@@ -0,0 +1,71 @@
+import os
+import sys
+
+import jinja2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from config import TestingConfig  # noqa: E402
+from factory import create_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+class InMemoryConfig(TestingConfig):
+    # Enough for tests that never touch a table: the models use PostgreSQL
+    # types, so anything that queries needs TEST_DATABASE_URL (see postgres_app).
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_BINDS = {}
+
+
+# Stand-ins for the page templates: each shows its data and pending flashes.
+TEMPLATES = {
+    name: '{{ %s }}{%% for m in get_flashed_messages() %%}[FLASH:{{ m }}]{%% endfor %%}' % data
+    for name, data in {
+        'pages/show_venue.html': 'venue.name',
+        'pages/show_artist.html': 'artist.name',
+        'pages/home.html': "'home'",
+        'pages/venues.html': "areas|length",
+        'errors/404.html': "'not found'",
+        'errors/500.html': "'error'",
+    }.items()
+}
+
+
+@pytest.fixture
+def app():
+    app = create_app(InMemoryConfig)
+    app.jinja_loader = jinja2.DictLoader(TEMPLATES)
+    # the warm-up hooks read the catalogue
+    app.before_first_request_funcs.clear()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def postgres_app():
+    '''The testing profile on TEST_DATABASE_URL, with an empty catalogue.'''
+    app = create_app(TestingConfig)
+    app.jinja_loader = jinja2.DictLoader(TEMPLATES)
+    app.before_first_request_funcs.clear()
+    with app.app_context():
+        try:
+            db.session.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        except OperationalError as e:
+            pytest.skip('TEST_DATABASE_URL is not reachable: {}'.format(e.orig))
+        db.create_all()
+        db.session.execute(db.text(
+            'TRUNCATE shows, venue_area_summary, venues, artists RESTART IDENTITY CASCADE'))
+        db.session.commit()
+        db.session.remove()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.dispose_engines(app)
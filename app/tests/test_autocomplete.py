@@ -0,0 +1,64 @@
+'''Per-app name indexes and their background reload.'''
+import time
+
+import pytest
+
+import autocomplete
+from autocomplete import lookup, name_indexes
+from conftest import InMemoryConfig
+from factory import create_app
+from test_concurrency import WAIT, Blocker, join, run_threads
+
+
+@pytest.fixture
+def catalogue(monkeypatch):
+    rows = {'artist': [(1, 'Guns N Petals')], 'venue': [(1, 'The Musical Hop')]}
+    monkeypatch.setattr(autocomplete, '_rows', lambda kind: list(rows[kind]))
+    return rows
+
+
+def names(results):
+    return [result['name'] for result in results]
+
+
+def test_stale_index_answers_while_one_thread_reloads_it(app, catalogue, monkeypatch):
+    with app.app_context():
+        assert names(lookup('artist', 'gun', 10, max_age=60)) == ['Guns N Petals']
+
+    catalogue['artist'] = [(1, 'Guns N Petals'), (2, 'Gunther')]
+    blocker = Blocker()
+    rows = autocomplete._rows
+
+    def slow_rows(kind):
+        blocker()
+        return rows(kind)
+
+    monkeypatch.setattr(autocomplete, '_rows', slow_rows)
+
+    results = []
+
+    def search():
+        with app.app_context():
+            results.append(names(lookup('artist', 'gun', 10, max_age=0)))
+
+    join(run_threads([search] * 8))
+    assert blocker.started.wait(WAIT)
+    assert results == [['Guns N Petals']] * 8
+    assert blocker.calls == 1
+
+    blocker.release.set()
+    with app.app_context():
+        deadline = time.monotonic() + WAIT
+        while name_indexes.state.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert names(lookup('artist', 'gun', 10, max_age=60)) == ['Guns N Petals', 'Gunther']
+
+
+def test_each_app_has_its_own_indexes(app, catalogue):
+    other = create_app(InMemoryConfig)
+    with app.app_context():
+        lookup('venue', 'the', 10, max_age=60)
+        name_indexes.state.indexes['venue'].put(2, 'The Dueling Pianos Bar')
+    with other.app_context():
+        assert name_indexes.state.indexes['venue'].loaded_at is None
+        assert names(lookup('venue', 'the', 10, max_age=60)) == ['The Musical Hop']
@@ -0,0 +1,204 @@
+'''Single-flight, fragment versions and stale-while-revalidate under threads.'''
+import threading
+import time
+
+import pytest
+from flask import session
+
+from app import coalesced
+from cache import fragments
+from page_cache import page_cache
+from routing import PIN_KEY
+from singleflight import SingleFlight
+
+WAIT = 5
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def join(threads):
+    for thread in threads:
+        thread.join(WAIT)
+        assert not thread.is_alive()
+
+
+class Blocker(object):
+    '''A build function that blocks until released and counts its calls.'''
+
+    def __init__(self, result='page'):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(WAIT)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    leader = Blocker()
+    followed = []
+    results = []
+    threads = run_threads([lambda: results.append(flight.do('key', leader))])
+    assert leader.started.wait(WAIT)
+    threads += run_threads(
+        [lambda: results.append(flight.do('key', lambda: followed.append(1)))] * 8)
+    time.sleep(0.1)  # let the followers start waiting
+    leader.release.set()
+    join(threads)
+    assert results == ['page'] * 9
+    assert leader.calls == 1
+    assert followed == []
+
+
+def test_followers_run_their_own_build_when_the_leader_fails():
+    flight = SingleFlight()
+    leader = Blocker(RuntimeError('database went away'))
+    errors = []
+    results = []
+
+    def lead():
+        try:
+            flight.do('key', leader)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = run_threads([lead])
+    assert leader.started.wait(WAIT)
+    threads += run_threads([lambda: results.append(flight.do('key', lambda: 'own'))] * 4)
+    time.sleep(0.1)
+    leader.release.set()
+    join(threads)
+    assert len(errors) == 1
+    assert results == ['own'] * 4
+
+
+def test_follower_stops_waiting_after_the_timeout():
+    flight = SingleFlight()
+    leader = Blocker()
+    threads = run_threads([lambda: flight.do('key', leader)])
+    assert leader.started.wait(WAIT)
+    try:
+        assert flight.do('key', lambda: 'own', timeout=0.05) == 'own'
+    finally:
+        leader.release.set()
+        join(threads)
+
+
+def test_pinned_visitor_never_joins_a_build(app):
+    leader = Blocker('before the edit')
+
+    def lead():
+        with app.test_request_context('/venues/1'):
+            coalesced(('venue', 1, 0), leader)
+
+    threads = run_threads([lead])
+    assert leader.started.wait(WAIT)
+    try:
+        with app.test_request_context('/venues/1'):
+            session[PIN_KEY] = time.time() + 60
+            assert coalesced(('venue', 1, 0), lambda: 'after the edit') == 'after the edit'
+    finally:
+        leader.release.set()
+        join(threads)
+
+
+def test_page_built_across_a_bump_is_not_served(app):
+    with app.app_context():
+        html, version = fragments.get('venue', 1)
+        assert html is None
+        fragments.bump('venue', 1)
+        fragments.set('venue', 1, '<old page>', version)
+        assert fragments.get('venue', 1) == (None, version + 1)
+
+
+def test_concurrent_bumps_are_not_lost(app):
+    def bump():
+        with app.app_context():
+            for _ in range(100):
+                fragments.bump('venue', 1)
+
+    join(run_threads([bump] * 8))
+    with app.app_context():
+        assert fragments.version('venue', 1) == 800
+
+
+def test_edit_during_a_build_is_not_hidden_by_it(app, client, monkeypatch):
+    catalogue = {'name': 'Old Name'}
+    first = threading.Event()
+    release = threading.Event()
+
+    def venue_page_data(venue_id):
+        name = catalogue['name']
+        if not first.is_set():
+            first.set()
+            assert release.wait(WAIT)
+        return {'id': venue_id, 'name': name}
+
+    monkeypatch.setattr('app.entity_validator', lambda side, entity_id: None)
+    monkeypatch.setattr('app.venue_page_data', venue_page_data)
+
+    stale = []
+    threads = run_threads([lambda: stale.append(app.test_client().get('/venues/1').data)])
+    assert first.wait(WAIT)
+    try:
+        # the edit commits and bumps while the first build is still running
+        catalogue['name'] = 'New Name'
+        with app.app_context():
+            fragments.bump('venue', 1)
+        assert client.get('/venues/1').data == b'New Name'
+    finally:
+        release.set()
+        join(threads)
+    assert stale == [b'Old Name']
+    assert client.get('/venues/1').data == b'New Name'
+
+
+@pytest.fixture
+def slow_page(app):
+    app.config['PAGE_CACHE_ENABLED'] = True
+    renders = {'count': 0, 'blocker': None}
+
+    @page_cache.cached(ttl=0.1, stale_ttl=60)
+    def slow():
+        renders['count'] += 1
+        if renders['blocker'] is not None:
+            renders['blocker']()
+        return 'render {}'.format(renders['count'])
+
+    app.add_url_rule('/slow', 'slow', slow)
+    return renders
+
+
+def test_stale_page_is_refreshed_once_in_the_background(app, client, slow_page):
+    response = client.get('/slow')
+    assert (response.headers['X-Page-Cache'], response.data) == ('miss', b'render 1')
+    time.sleep(0.15)
+
+    blocker = slow_page['blocker'] = Blocker()
+    responses = []
+    join(run_threads([lambda: responses.append(app.test_client().get('/slow'))] * 10))
+    assert blocker.started.wait(WAIT)
+    # every request was answered from the stale copy while one refresh runs
+    assert {(r.headers['X-Page-Cache'], r.data) for r in responses} == {('stale', b'render 1')}
+    assert slow_page['count'] == 2
+
+    blocker.release.set()
+    with app.app_context():
+        deadline = time.monotonic() + WAIT
+        while page_cache.state.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not page_cache.state.refreshing
+    response = client.get('/slow')
+    assert (response.headers['X-Page-Cache'], response.data) == ('hit', b'render 2')
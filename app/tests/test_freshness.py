@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+import pytest
+from flask import flash
+
+from freshness import conditional_get
+
+LAST_MODIFIED = datetime(2024, 3, 5, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def page(app):
+    outcome = {'status': 200, 'flash': None}
+
+    @conditional_get(lambda: (LAST_MODIFIED, ('page',)))
+    def view():
+        if outcome['flash']:
+            flash(outcome['flash'])
+        return 'page', outcome['status']
+
+    app.add_url_rule('/page', 'page', view)
+    return outcome
+
+
+def test_page_gets_validators_and_revalidates(client, page):
+    response = client.get('/page')
+    assert response.headers['ETag']
+    assert response.headers['Last-Modified']
+    again = client.get('/page', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+@pytest.mark.parametrize('outcome', [
+    {'status': 500},
+    {'status': 404},
+    {'flash': 'Something went wrong. Please try again.'},
+])
+def test_error_pages_get_no_validators(client, page, outcome):
+    page.update(outcome)
+    response = client.get('/page')
+    assert 'ETag' not in response.headers
+    assert 'Last-Modified' not in response.headers
+
+
+def test_bare_if_modified_since_is_ignored_by_default(client, page):
+    response = client.get('/page', headers={'If-Modified-Since': 'Wed, 06 Mar 2024 00:00:00 GMT'})
+    assert response.status_code == 200
@@ -0,0 +1,26 @@
+'''Listing pages issue a fixed number of queries whatever the catalogue size.'''
+import random
+
+from bench.seed import seed
+from models import db
+
+
+def query_count(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return int(response.headers['X-Query-Count'])
+
+
+def test_venues_query_count_does_not_grow_with_the_catalogue(postgres_app):
+    client = postgres_app.test_client()
+    rng = random.Random(1)
+    with postgres_app.app_context():
+        seed(1, 1, 1, rng)
+        db.session.remove()
+    one_venue = query_count(client, '/venues')
+
+    with postgres_app.app_context():
+        seed(49, 200, 2000, rng)
+        db.session.remove()
+    # the testing profile raises QueryBudgetExceeded on a budget overrun
+    assert query_count(client, '/venues') == one_venue
@@ -0,0 +1,76 @@
+'''Which views read from replicas, and read-your-writes pins.'''
+import time
+
+import pytest
+
+from conftest import InMemoryConfig
+from factory import create_app
+from models import db
+from routing import PIN_KEY, read_only
+
+events = db.table('events', db.column('name'))
+
+
+def routing_app(tmp_path, replicas):
+    class Config(InMemoryConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(tmp_path / 'primary.db')
+        SQLALCHEMY_BINDS = {
+            'replica_{}'.format(i): 'sqlite:///{}'.format(tmp_path / 'replica_{}.db'.format(i))
+            for i in range(replicas)
+        }
+
+    app = create_app(Config)
+    app.before_first_request_funcs.clear()
+
+    def write():
+        db.session.execute(events.insert().values(name='edit'))
+        db.session.commit()
+        return 'saved'
+
+    def read():
+        return str(db.session.get_bind().url)
+
+    app.add_url_rule('/write', 'write', write, methods=['POST'])
+    app.add_url_rule('/read', 'read', read_only(read), methods=['GET', 'POST'])
+    app.add_url_rule('/form', 'form', lambda: read())
+    with app.app_context():
+        for key in [None] + list(Config.SQLALCHEMY_BINDS):
+            with db.get_engine(app, bind=key).begin() as connection:
+                connection.exec_driver_sql('CREATE TABLE events (name TEXT)')
+    return app
+
+
+def test_only_read_only_views_use_replicas(tmp_path):
+    app = routing_app(tmp_path, replicas=1)
+    client = app.test_client()
+    assert client.get('/read').data.endswith(b'replica_0.db')
+    assert client.post('/read').data.endswith(b'replica_0.db')
+    assert client.get('/form').data.endswith(b'primary.db')
+
+
+def test_write_pins_the_visitor_to_the_primary(tmp_path):
+    app = routing_app(tmp_path, replicas=1)
+    client = app.test_client()
+    assert client.get('/read').data.endswith(b'replica_0.db')
+    response = client.post('/write')
+    assert 'Set-Cookie' in response.headers
+    assert client.get('/read').data.endswith(b'primary.db')
+
+
+def test_write_without_replicas_sets_no_cookie(tmp_path):
+    app = routing_app(tmp_path, replicas=0)
+    client = app.test_client()
+    response = client.post('/write')
+    assert response.data == b'saved'
+    assert 'Set-Cookie' not in response.headers
+
+
+@pytest.mark.parametrize('replicas', [0, 1])
+def test_expired_pin_is_cleared(tmp_path, replicas):
+    app = routing_app(tmp_path, replicas)
+    client = app.test_client()
+    with client.session_transaction() as visitor:
+        visitor[PIN_KEY] = time.time() - 1
+    client.get('/read')
+    with client.session_transaction() as visitor:
+        assert PIN_KEY not in visitor
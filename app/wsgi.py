@@ -0,0 +1,40 @@
+'''Production WSGI entry point.
+
+    gunicorn wsgi:app
+
+It builds the `production` profile unless FYYUR_CONFIG names another one,
+so a deployment that forgets to set it does not run with DEBUG on and a
+per-process SECRET_KEY.
+
+Importing this module warms the process before it serves anything: Jinja
+templates are compiled, locale data and date patterns are loaded, and the
+autocomplete indexes are built. Under gunicorn's preload_app that happens
+once in the master, and forked workers inherit the result. The master then
+drops its database connections so that no socket is ever shared with a
+worker (see post_fork in gunicorn.conf.py).
+'''
+import os
+
+from autocomplete import build_indexes
+from dates import preload_locales
+from factory import create_app
+from models import db
+
+
+def warm_up(app):
+    with app.app_context():
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+        preload_locales(app.config['LANGUAGES'])
+        try:
+            build_indexes()
+        except Exception:
+            # workers build the indexes on first use instead
+            app.logger.exception('could not build autocomplete indexes during warm-up')
+        finally:
+            db.session.remove()
+    db.dispose_engines(app)
+
+
+app = create_app(os.environ.get('FYYUR_CONFIG') or 'production')
+warm_up(app)